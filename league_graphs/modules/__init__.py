@@ -1,3 +1,13 @@
 # -*- coding: utf-8 -*-
-from . import db_connector
-from . import graph_generator
+# Submodules are imported on first access so that each entry point only pays for the stacks
+# (database, xlsx, raster) of the stages it actually runs
+import importlib
+
+__all__ = ["db_connector", "graph_generator"]
+
+
+def __getattr__(name : str):
+    """Import the submodules listed in __all__ lazily (PEP 562)"""
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from .graph_generator import GraphGenerator
+from typing import TYPE_CHECKING
+import io
+import json
+import logging
+import math
+import os
+
+if TYPE_CHECKING:
+    import PIL.Image
+
+logger = logging.getLogger(__name__)
+
+
+class BatchExporter(object):
+    """Bulk PNG export of club graphs: the shared background (tiers, axes, markers) is rasterized once
+    and each club's title and plot lines are drawn onto a copy of that bitmap"""
+    def __init__(self, generator : GraphGenerator):
+        """:param generator: Generator holding the ingested data and the configured rasterizer."""
+        self.generator = generator
+        self.rasterizer = generator.rasterizer
+        self.background = None
+
+    def get_background_image(self) -> "PIL.Image.Image":
+        """Rasterize the shared background on first use and keep it for the following clubs"""
+        if self.background is None:
+            generator = self.generator
+            with generator.profiler.stage("background"):
+                root = generator.get_svg_body("", title=False)
+                generator.get_background(root)
+            with generator.profiler.stage("rasterization"):
+                self.background = self.rasterizer.render_image(root=root).convert("RGB")
+        return self.background
+
+    def render_club(self, club_info : dict) -> "PIL.Image.Image":
+        """Rasterize one club's graph by drawing its title and plot lines over the shared background.
+
+        :param club_info: Club information of the plotted club.
+        :return: RGB image of the graph."""
+        generator = self.generator
+        background = self.get_background_image()
+        with generator.profiler.subject("club", club_info["full_name"]):
+            with generator.profiler.stage("plot_lines"):
+                root = generator.get_svg_body(club_info["full_name"], fill=False)
+                generator.get_plot_line(root, club_info)
+            with generator.profiler.stage("rasterization"):
+                return self.rasterizer.render_layer(root, background)
+
+    def export_pngs(self, clubs : list[dict]):
+        """Write one PNG per club to the usual output paths.
+
+        :param clubs: Club information of the clubs to be exported."""
+        logger.info(f"Exporting {len(clubs)} club PNG files over a shared background")
+        for club_info in clubs:
+            buffer = io.BytesIO()
+            self.render_club(club_info).save(buffer, format="PNG")
+            self.generator.outputs.write(f"{self.generator.get_output_file_path(club_info['short_name'])}.png", buffer.getvalue())
+        self.generator.outputs.log_summary()
+
+    def export_sheet(self, clubs : list[dict], sheet_path : str, columns : int = 0, tile_scale : float = 1.0):
+        """Pack every club's graph into one tiled PNG sheet, with a JSON index of the tile offsets.
+
+        :param clubs: Club information of the clubs to be exported, in tile order.
+        :param sheet_path: Path of the PNG sheet; the index is written next to it with a .json extension.
+        :param columns: Number of tiles per row; if zero, a roughly square sheet is produced.
+        :param tile_scale: Scale applied to each tile (e.g. 0.5 for thumbnails)."""
+        from PIL import Image
+
+        background = self.get_background_image()
+        tile_width = round(background.size[0] * tile_scale)
+        tile_height = round(background.size[1] * tile_scale)
+        columns = columns or max(1, math.ceil(math.sqrt(len(clubs))))
+        rows = max(1, math.ceil(len(clubs) / columns))
+
+        logger.info(f"Exporting {len(clubs)} clubs into a {columns}x{rows} sheet {sheet_path}")
+        sheet = Image.new("RGB", (columns * tile_width, rows * tile_height), "white")
+        index = {"tile_width": tile_width, "tile_height": tile_height, "columns": columns, "rows": rows, "tiles": {}}
+
+        for i, club_info in enumerate(clubs):
+            image = self.render_club(club_info)
+            if tile_scale != 1.0:
+                image = image.resize((tile_width, tile_height), Image.LANCZOS)
+            x, y = (i % columns) * tile_width, (i // columns) * tile_height
+            sheet.paste(image, (x, y))
+            index["tiles"][club_info["short_name"]] = {"full_name": club_info["full_name"], "x": x, "y": y}
+
+        directory = os.path.dirname(sheet_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        buffer = io.BytesIO()
+        sheet.save(buffer, format="PNG")
+        self.generator.outputs.write(sheet_path, buffer.getvalue())
+        index_data = json.dumps(index, ensure_ascii=False, indent=2).encode("utf-8")
+        self.generator.outputs.write(f"{os.path.splitext(sheet_path)[0]}.json", index_data)
+        self.generator.outputs.log_summary()
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from .main import ROOT_DIR
+from .models import model
+from .query_stats import InstrumentedCursor, QueryStats
 from collections.abc import Generator
 from contextlib import contextmanager
 from os import getenv, path
@@ -11,10 +13,16 @@ logger = logging.getLogger(__name__)
 
 class DBConnector(object):
     """Provides tools for connecting to a PostgreSQL database"""
-    def __init__(self, config : dict):
+    def __init__(self, config : dict, initialize : bool = True):
         """Initiate PostgreSQL database connection using the configuration at database.conf
 
-        :param config: Dictionary with psycopg2 connection configurations."""
+        :param config: Dictionary with psycopg2 connection configurations.
+        :param initialize: Whether to run the database/role bootstrap through the "postgres" database first."""
+        # Configure query instrumentation and per-row logging of the Model layer
+        config_stats = config.get("query_stats") or {}
+        self.query_stats = QueryStats(config_stats)
+        model.row_logging.set_sample(int(config_stats.get("row_log_sample", 1)))
+
         # Gather "postgres" database configurations and store on self.config_pg
         config_pg = dict(config.get("database_pg").items())
         password_pg = getenv("POSTGRES_DB_PW")
@@ -25,11 +33,19 @@ class DBConnector(object):
         config_db = dict(config.get("database_db").items())
         password_db = getenv("LEAGUE_GRAPHS_DB_PW")
         config_db["password"] = password_db
-        database_db = config_db["database"]
-        user_db = config_db["user"]
         self.config_db = config_db
 
         # Connect to "postgres" database and run initialization procedure
+        if initialize:
+            self.initialize_database()
+
+        # Connect to app database "league_graphs"
+        self.cr = self.connect_to_db(config_db)
+
+    def initialize_database(self):
+        """Create the app database and user if needed, through the "postgres" database"""
+        config_pg, password_pg = self.config_pg, self.config_pg["password"]
+        database_db, user_db, password_db = self.config_db["database"], self.config_db["user"], self.config_db["password"]
         with self.connect_to_db_ctx(config_pg) as cr:
             cr.connection.autocommit = True
             with open(path.join(ROOT_DIR, "sql/initLeagueGraphs.sql")) as fp:
@@ -42,9 +58,6 @@ class DBConnector(object):
 
             logger.info(f"Successfully configured database {database_db}")
 
-        # Connect to app database "league_graphs"
-        self.cr = self.connect_to_db(config_db)
-
     def __enter__(self):
         """Default context manager starting method"""
         return self
@@ -59,7 +72,8 @@ class DBConnector(object):
         :param config: Dictionary containing database name, user and password for connection."""
         try:
             connection = psycopg2.connect(**config)
-            cr = connection.cursor()
+            cr = connection.cursor(cursor_factory=InstrumentedCursor)
+            cr.stats = self.query_stats
         except Exception as e:
             logger.exception(f"Unable to connect to database {config['database']}")
             raise e
@@ -83,3 +97,4 @@ class DBConnector(object):
         self.cr.close()
         self.cr.connection.close()
         logger.info(f"Closed cursor and connection to {database}")
+        self.query_stats.log_summary()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+from collections.abc import Callable, Container
+from itertools import combinations
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DerbyCatalogue(object):
+    """Derbies and rivalries loaded from a JSON data file, validated against the ingested clubs.
+
+    The file holds a "derbies" list of {"full_name", "clubs"} entries (an empty full_name is rendered
+    as "A vs B") and an optional "regions" list of {"name", "clubs"} entries, for which every pairwise
+    rivalry between the region's clubs is generated."""
+    def __init__(self, path : str, club_names : Container[str], get_short_name : Callable[[str, bool], str]):
+        """Load, expand and validate the catalogue, raising ValueError listing every invalid entry.
+
+        :param path: Path of the JSON data file.
+        :param club_names: Full names of the ingested clubs.
+        :param get_short_name: Function sanitizing a name into a file name (GraphGenerator._get_short_name)."""
+        with open(path, encoding="utf-8") as fp:
+            data = json.load(fp)
+
+        entries = [(derby["full_name"], tuple(derby["clubs"])) for derby in data.get("derbies", [])]
+        for region in data.get("regions", []):
+            entries += [("", pair) for pair in combinations(region["clubs"], 2)]
+
+        self.derbies, self.by_short_name, self.by_club = [], {}, {}
+        errors = []
+        for full_name, clubs in entries:
+            unknown = [club for club in clubs if club not in club_names]
+            if unknown:
+                errors.append(f"{full_name or ' vs '.join(clubs)}: unknown club(s) {', '.join(unknown)}")
+                continue
+
+            display_name = full_name or " vs ".join(clubs)
+            short_name = get_short_name(display_name, True)
+            if short_name in self.by_short_name:
+                # Same pair listed twice (e.g. explicitly and through a region) is not an error
+                if set(self.by_short_name[short_name]["clubs"]) != set(clubs):
+                    errors.append(f"{display_name}: file name {short_name} already used")
+                continue
+
+            derby = {"full_name": full_name, "clubs": clubs, "short_name": short_name}
+            self.derbies.append(derby)
+            self.by_short_name[short_name] = derby
+            for club in clubs:
+                self.by_club.setdefault(club, []).append(derby)
+
+        if errors:
+            raise ValueError(f"Invalid derby catalogue {path}:\n" + "\n".join(errors))
+        logger.info(f"Loaded {len(self.derbies)} derbies from {path}")
+
+    def get_schedule(self, derbies : list[dict] | None = None) -> tuple[list[dict], dict[str, int]]:
+        """Order derbies so that those sharing the most featured clubs are rendered next to each other.
+
+        :param derbies: Subset of the catalogue's derbies to schedule; all of them if not set.
+        :return: Ordered derbies, and the index of the last derby featuring each club
+            (after which that club's cached plot line data is no longer needed)."""
+        derbies = self.derbies if derbies is None else derbies
+        frequency = Counter(club for derby in derbies for club in derby["clubs"])
+        ranking = {club: i for i, (club, _) in enumerate(frequency.most_common())}
+        schedule = sorted(derbies, key=lambda derby: min(ranking[club] for club in derby["clubs"]))
+
+        last_use = {}
+        for i, derby in enumerate(schedule):
+            for club in derby["clubs"]:
+                last_use[club] = i
+        return schedule, last_use
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Pixel origin of the plot area: first season's x, and y of overall position 0
+PLOT_X_ORIGIN = 45
+PLOT_Y_ORIGIN = 66
+
+
+class PixelTable(dict):
+    """Pixel coordinate of each season index or overall position, precomputed over the pyramid's range
+    and extended on lookup for values outside of it (e.g. positions below the recorded league sizes)"""
+    def __init__(self, origin : int, increment : int, size : int):
+        super().__init__((i, origin + i * increment) for i in range(size))
+        self.origin, self.increment = origin, increment
+
+    def __missing__(self, key : int) -> int:
+        value = self[key] = self.origin + key * self.increment
+        return value
+
+
+class GeometryIndex(object):
+    """Season/tier geometry of the league pyramid, computed once from the ingested league sizes and shared
+    by all drawing code: tier boundaries, pixel coordinates, and the static background paths"""
+    def __init__(self, league_sizes : dict[str, list[int]], max_depth : int, x_inc : int, y_inc : int):
+        """:param league_sizes: Overall position of the last club of each tier, per season (cumulative tier boundaries).
+        :param max_depth: Deepest overall position of the pyramid over all seasons.
+        :param x_inc: Horizontal distance between two seasons, in pixels.
+        :param y_inc: Vertical distance between two overall positions, in pixels."""
+        self.seasons = list(league_sizes)
+        self.no_seasons = len(self.seasons)
+        self.max_depth = max_depth
+        self.x_inc, self.y_inc = x_inc, y_inc
+        self.x_max = self.no_seasons * x_inc
+        self.y_max = max_depth * y_inc
+
+        # tier_boundaries[tier index][season index]
+        pyramid_size = max((len(sizes) for sizes in league_sizes.values()), default=0)
+        self.tier_boundaries = [[league_sizes[season][i] for season in self.seasons] for i in range(pyramid_size)]
+        self.x = PixelTable(PLOT_X_ORIGIN, x_inc, self.no_seasons)
+        self.y = PixelTable(PLOT_Y_ORIGIN, y_inc, max_depth + 1)
+
+        self.tier_paths = [self._get_tier_path(boundaries) for boundaries in self.tier_boundaries]
+        self.outline_path, self.fiveyear_path = self._get_marker_paths()
+
+    def _get_tier_path(self, boundaries : list[int]) -> str:
+        """Background shape of one tier, from the top of the graph down to the tier's boundary on each season"""
+        d = f"M39,69v{boundaries[0] * self.y_inc}"
+        x_acc = self.x_inc
+
+        for x in range(1, len(boundaries)):
+            if boundaries[x] == boundaries[x-1]:
+                x_acc += self.x_inc
+                continue
+
+            d += f"h{x_acc}v{(boundaries[x] - boundaries[x-1]) * self.y_inc}"
+            x_acc = self.x_inc
+
+        return d + f"h{x_acc}v{boundaries[-1] * self.y_inc * -1}z"
+
+    def _get_marker_paths(self) -> tuple[str, str]:
+        """Outline with the year/position markers, and the 5-year markers"""
+        no_year_marks = (self.no_seasons - 1)
+        no_position_marks = len(range(11, self.max_depth, 10))
+        year_lines = f"M45,{self.y_max + 69.5}v6{no_year_marks * 'm12-6v6'}"
+        posi_lines = f"M32.5,71h6{no_position_marks * 'm-6,50h6'}"
+        outline_path = f"M39,69h{self.x_max}v{self.y_max}H39z{year_lines}{posi_lines}"
+
+        fiveyear_mark = f"m60-{self.y_max - 1}v{self.y_max - 1}"
+        no_fiveyear_marks = (self.no_seasons - 2) // 5
+        fiveyear_path = f"M57,69.5v{self.y_max - 1}{no_fiveyear_marks * fiveyear_mark}"
+        return outline_path, fiveyear_path
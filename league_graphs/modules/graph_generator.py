@@ -1,41 +1,102 @@
 # -*- coding: utf-8 -*-
+from collections import deque
+from collections.abc import Container, Iterator
+import copy
+import gc
+import gzip
+import hashlib
+import json
 import logging
-import openpyxl
 import os
+from .derbies import DerbyCatalogue
+from .geometry import GeometryIndex
+from .output_files import OutputWriter, write_file_atomic
+from .main import ROOT_DIR, get_config_bool
+from .profiling import RunProfiler, get_memory_usage
+from .rasterizers import Rasterizer, get_rasterizer
+from .svg_compact import compact_svg
 from lxml import etree
-from reportlab.graphics import renderPM
-from svglib.svglib import svg2rlg
 from unidecode import unidecode
 
 logger = logging.getLogger(__name__)
 
+# Longest comparison short name used in file names, well within the usual 255-byte file name limit
+# once the "_League_Performances" suffix, extensions and temporary file affixes are added
+MAX_COMPARISON_SHORT_NAME = 120
+
 
 class GraphGenerator(object):
-    def __init__(self):
-        file_name = "Graphs_SVG_Portugal.xlsx"
-        logger.info(f"Processing input file {file_name}")
-        self.wb = openpyxl.load_workbook(filename=file_name, read_only=True, data_only=True)
-
-        self.set_league_sizes()
-        self.set_club_info()
-        self.set_derbies()
+    def __init__(self, config : dict | None = None, artifact_path : str | None = None, streaming : bool | None = None):
+        """Ingest the source data, either from the workbook or from an artifact written by dump_artifact().
+
+        :param config: Dictionary of configuration sections coming from league_graphs.conf.
+        :param artifact_path: Path of a previously dumped ingestion artifact; if not set, the workbook is parsed.
+        :param streaming: Whether to only keep the derby clubs in memory and read every other club from the
+            workbook while running (see run); defaults to [streaming] enabled, and is ignored with an artifact."""
+        config = config or {}
+        config_streaming = config.get("streaming") or {}
+        if streaming is None:
+            streaming = get_config_bool(config_streaming, "enabled", False)
+        self.streaming = streaming and not artifact_path
+        self.stream_batch_size = int(config_streaming.get("batch_size", 1000))
+        self.max_memory_mb = float(config_streaming.get("max_memory_mb", 0))
+        self.profiler = RunProfiler(config.get("profiling"))
+        self.profiler.start()
+        self.workbook_path = None
+
+        with self.profiler.stage("ingestion"):
+            if artifact_path:
+                logger.info(f"Loading ingestion artifact {artifact_path}")
+                self.load_artifact(artifact_path)
+            else:
+                import openpyxl
+                file_name = (config.get("pipeline") or {}).get("workbook", "Graphs_SVG_Portugal.xlsx")
+                logger.info(f"Processing input file {file_name}{' in streaming mode' if self.streaming else ''}")
+                self.workbook_path = file_name
+                self.wb = openpyxl.load_workbook(filename=file_name, read_only=True, data_only=True)
+                self.set_league_sizes()
+                if self.streaming:
+                    # The workbook stays open, as run() reads the clubs from it
+                    self.club_names = [name for _, name in self.get_club_columns()]
+                else:
+                    self.set_club_info()
+                    self.wb.close()
+            if not self.streaming:
+                self.club_names = list(self.club_info)
+        self.set_derbies((config.get("derbies") or {}).get("catalogue", "config/derbies.json"))
+        if self.streaming:
+            with self.profiler.stage("ingestion"):
+                self.club_info = {club_info["full_name"]: club_info for club_info in self.iter_club_info(self.derby_catalogue.by_club)}
         self.create_directories()
 
         self.x_inc = 12
         self.y_inc = 5
-        self.x_max = len(self.league_sizes) * self.x_inc
-        self.y_max = self.max_depth * self.y_inc
+        self.set_geometry()
         self.year_y = 502
         self.year_text = 1940
         self.tier_colors = ["#cccccc", "#b3b3b3", "#999999", "#777777"]
-
-        self.wb.close()
+        self.legend_column_width = 160
+        self.legend_row_height = 18
+        self.rasterize = True
+        config_output = config.get("output") or {}
+        self.rasterizer = get_rasterizer(config_output.get("rasterizer", "reportlab"))
+        self.svg_mode = config_output.get("svg_mode", "standard")
+        self.svgz = get_config_bool(config_output, "svgz", False)
+        self.archive_path = config_output.get("archive", "")
+        self.outputs = OutputWriter(get_config_bool(config_output, "skip_unchanged", True), keep_paths=bool(self.archive_path))
 
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
     #                                  CLASS SETTERS                                  #
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
     def set_league_sizes(self):
         """Process the League Sizes worksheet and extract the size of each league tier on each season"""
+        league_sizes, pyramid_size, max_depth = self.read_league_sizes()
+        self.league_sizes, self.no_seasons, self.pyramid_size, self.max_depth = league_sizes, len(league_sizes), pyramid_size, max_depth
+
+    def read_league_sizes(self) -> tuple[dict[str, list[int]], int, int]:
+        """Read the League Sizes worksheet without changing the generator's state (see set_league_sizes).
+
+        :return: Cumulative tier sizes by season, number of tiers and maximum overall depth."""
         ws_league_sizes, row_idx = self.wb["League Sizes"], -1
         league_sizes, pyramid_size, max_depth = {}, 0, 0
 
@@ -58,108 +119,182 @@ class GraphGenerator(object):
                     league_sizes[season].append(value)
                     if value > max_depth: max_depth = value
 
-        self.league_sizes, self.no_seasons, self.pyramid_size, self.max_depth = league_sizes, len(league_sizes), pyramid_size, max_depth
+        return league_sizes, pyramid_size, max_depth
 
     def set_club_info(self):
         """Process the Clubs worksheet to compile each club's info and each of its seasons' overall league position"""
-        ws_clubs = self.wb["Clubs"]
-        club_info = {}
-        lines = list(ws_clubs.rows)
-
-        for club_idx in range(1, len(lines[0]), 3):
-            club_name_cell = lines[0][club_idx]
-            club_line_cell = lines[1][club_idx]
-            club_name_text = club_name_cell.value
-
-            if club_name_text:
-                colors = [club_name_cell.fill.fgColor, club_line_cell.fill.fgColor]
-
-                for i, color in enumerate(colors):
-                    # white/black colors go to themes 0/1 respectively
-                    if not isinstance(color.rgb, str):
-                        colors[i] = "#FFFFFF" if color.theme == 0 else "#000000"
-                    # if it's transparent, for some reason, paint if black
-                    elif color.rgb[0:2] == "00":
-                        colors[i] = "#000000"
-                    else:
-                        colors[i] = f"#{color.rgb[2:]}"
-
-                club_info[club_name_text] = {
-                    "full_name": club_name_text,
-                    "short_name": self._get_short_name(club_name_text),
-                    "line_type": club_line_cell.value or "solid",
-                    "line_color": colors.copy(),
-                    "data": {},
-                }
+        self.club_info = {club_info["full_name"]: club_info for club_info in self.iter_club_info()}
+
+    def get_club_columns(self) -> list[tuple[int, str]]:
+        """Index of the first column and name of each club of the Clubs worksheet, read from its first row only"""
+        header = next(self.wb["Clubs"].iter_rows(max_row=1))
+        return [(club_idx, header[club_idx].value) for club_idx in range(1, len(header), 3) if header[club_idx].value]
+
+    def iter_club_info(self, names : Container[str] | None = None, batch_size : int = 0) -> Iterator[dict]:
+        """Yield the club informations of the Clubs worksheet one club at a time. The worksheet is read in a
+        single pass into a compact buffer (a flat list of raw values per club), from which the club informations
+        are built one batch of clubs at a time, so that only one batch's season dictionaries are held in memory.
+
+        :param names: If set, only read these clubs.
+        :param batch_size: Number of clubs built from the buffer at a time; if zero, all clubs are built at once."""
+        columns = [(club_idx, name) for club_idx, name in self.get_club_columns() if names is None or name in names]
+        if not columns:
+            return
+        seasons, buffer = self._read_club_columns(columns)
+        batch_size = batch_size or len(columns)
+        while buffer:
+            # Each batch's raw values are dropped from the buffer as its club informations are built
+            batch = [buffer.popleft() for _ in range(min(batch_size, len(buffer)))]
+            yield from [self._get_club_info(club, seasons) for club in batch]
+
+    def _read_club_columns(self, columns : list[tuple[int, str]]) -> tuple[list, deque[dict]]:
+        """Read the given Clubs worksheet columns (see get_club_columns) in one pass.
+
+        :return: Seasons, and for each club its full name, line type, colors and flat list of
+            league, position and overall values (three per season)."""
+        seasons, buffer = [], deque()
+        if not columns:
+            return seasons, buffer
+        for row_idx, line in enumerate(self.wb["Clubs"].iter_rows(max_col=columns[-1][0] + 3)):
+            if row_idx == 0:
+                name_cells = line
+                continue
 
-                for line in lines[2:]:
-                    if line[0].value:
-                        club_info[club_name_text]["data"][line[0].value] = {
-                            "league": line[club_idx + 0].value or -1,
-                            "position": line[club_idx + 1].value or -1,
-                            "overall": line[club_idx + 2].value or -1,
-                        }
-
-        self.club_info = club_info
-
-    def set_derbies(self):
-        """List of relevant Portuguese derbies to have SVGs generated"""
-        self.derbies = [
-            {"full_name": "Clássico", "clubs": ("SL Benfica", "FC Porto")},
-            {"full_name": "Dérbi de Lisboa", "clubs": ("SL Benfica", "Sporting CP")},
-            {"full_name": "Dérbi do Minho", "clubs": ("SC Braga", "Vitória SC")},
-            {"full_name": "Dérbi da Invicta", "clubs": ("FC Porto", "Boavista FC")},
-            {"full_name": "Dérbi da Madeira", "clubs": ("CS Marítimo", "CD Nacional")},
-            {"full_name": "Dérbi Beirão", "clubs": ("Académico de Viseu FC", "CD Tondela")},
-            {"full_name": "Dérbi do Barreiro", "clubs": ("FC Barreirense", "GD Fabril do Barreiro")},
-            {"full_name": "Dérbi de Matosinhos", "clubs": ("Leixões SC", "Leça FC")},
-            {"full_name": "Três Grandes", "clubs": ("SL Benfica", "FC Porto", "Sporting CP")},
-            {"full_name": "Dérbi Algarvio", "clubs": ("SC Farense", "SC Olhanense", "Portimonense SC")},
-            {"full_name": "", "clubs": ("FC Porto", "Sporting CP")},
-            {"full_name": "", "clubs": ("Vitória SC", "Boavista FC")},
-            {"full_name": "", "clubs": ("SC Farense", "SC Olhanense")},
-            {"full_name": "", "clubs": ("SC Farense", "Portimonense SC")},
-            {"full_name": "", "clubs": ("SC Olhanense", "Portimonense SC")},
-            {"full_name": "", "clubs": ("CF Belenenses", "Atlético CP")},
-            {"full_name": "", "clubs": ("CD Feirense", "AD Sanjoanense")},
-            {"full_name": "", "clubs": ("Leixões SC", "Rio Ave FC")},
-        ]
+            if row_idx == 1:
+                for club_idx, club_name_text in columns:
+                    club_name_cell = name_cells[club_idx]
+                    club_line_cell = line[club_idx]
+                    colors = [club_name_cell.fill.fgColor, club_line_cell.fill.fgColor]
+
+                    for i, color in enumerate(colors):
+                        # white/black colors go to themes 0/1 respectively
+                        if not isinstance(color.rgb, str):
+                            colors[i] = "#FFFFFF" if color.theme == 0 else "#000000"
+                        # if it's transparent, for some reason, paint if black
+                        elif color.rgb[0:2] == "00":
+                            colors[i] = "#000000"
+                        else:
+                            colors[i] = f"#{color.rgb[2:]}"
+
+                    buffer.append({"full_name": club_name_text, "line_type": club_line_cell.value, "line_color": colors, "values": []})
+                continue
+
+            if line[0].value:
+                seasons.append(line[0].value)
+                for (club_idx, _), club in zip(columns, buffer):
+                    club["values"] += (line[club_idx].value, line[club_idx + 1].value, line[club_idx + 2].value)
+
+        return seasons, buffer
+
+    def _get_club_info(self, club : dict, seasons : list) -> dict:
+        """Build a club's informations from its buffered worksheet values (see _read_club_columns)"""
+        values = club["values"]
+        return {
+            "full_name": club["full_name"],
+            "short_name": self._get_short_name(club["full_name"]),
+            "line_type": club["line_type"] or "solid",
+            "line_color": club["line_color"],
+            "data": {
+                season: {
+                    "league": values[i * 3] or -1,
+                    "position": values[i * 3 + 1] or -1,
+                    "overall": values[i * 3 + 2] or -1,
+                }
+                for i, season in enumerate(seasons)
+            },
+        }
+
+    def set_geometry(self):
+        """Build the pyramid geometry shared by all drawing code from the ingested league sizes"""
+        self.geometry = GeometryIndex(self.league_sizes, self.max_depth, self.x_inc, self.y_inc)
+        self.x_max = self.geometry.x_max
+        self.y_max = self.geometry.y_max
+
+    def set_derbies(self, catalogue_path : str):
+        """Load the Portuguese derbies to have SVGs generated from the derby catalogue, validated against the ingested clubs.
+
+        :param catalogue_path: Path of the JSON derby catalogue, relative to the league_graphs directory."""
+        self.derby_catalogue_path = catalogue_path
+        self.derby_catalogue = DerbyCatalogue(os.path.join(ROOT_DIR, catalogue_path), self.club_names, self._get_short_name)
+        self.derbies = self.derby_catalogue.derbies
+        # Plot line elements of the clubs still to be drawn in a derby, keyed by club name and id prefix (see run)
+        self.plot_line_fragments = {}
+        self.cached_clubs = set()
 
     def create_directories(self):
         """Check for the existence of the landing directories and creates them if necessary"""
-        for directory in ("graphs_clubs", "graphs_derbies"):
+        for directory in ("graphs_clubs", "graphs_derbies", "graphs_comparisons"):
             if not os.path.exists(directory):
                 os.makedirs(directory)
 
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    #                              INGESTION ARTIFACTS                                #
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    def dump_artifact(self, artifact_path : str):
+        """Write the ingested data to a JSON file, so later stages can skip parsing the workbook.
+
+        :param artifact_path: Path of the JSON file to be written."""
+        directory = os.path.dirname(artifact_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        artifact = {
+            "league_sizes": self.league_sizes,
+            "pyramid_size": self.pyramid_size,
+            "max_depth": self.max_depth,
+            "club_info": self.club_info,
+        }
+        # Written atomically: a partial artifact would break every stage reading it
+        write_file_atomic(artifact_path, json.dumps(artifact, ensure_ascii=False).encode("utf-8"))
+        logger.info(f"Wrote ingestion artifact {artifact_path} ({len(self.club_info)} clubs)")
+
+    def load_artifact(self, artifact_path : str):
+        """Set the ingested data from a JSON file written by dump_artifact().
+
+        :param artifact_path: Path of the JSON file to be read."""
+        with open(artifact_path, encoding="utf-8") as fp:
+            artifact = json.load(fp)
+
+        self.league_sizes = artifact["league_sizes"]
+        self.no_seasons = len(self.league_sizes)
+        self.pyramid_size = artifact["pyramid_size"]
+        self.max_depth = artifact["max_depth"]
+        self.club_info = artifact["club_info"]
+
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
     #                        HELPER METHODS FOR FILE GENERATION                       #
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
-    def get_svg_body(self, full_name : str, derby=False) -> etree._Element:
+    def get_svg_body(self, full_name : str, derby=False, fill=True, title=True, height=500) -> etree._Element:
         """Construct main body of SVG XML.
 
         :param full_name: Full representation of club name.
         :param derby: Whether the SVG is for just one club (False) or multiple (True).
+        :param fill: Whether to add the white background (left out for layers drawn over a shared background).
+        :param title: Whether to add the graph title (left out for the shared background itself).
+        :param height: Height of the document (taller than the graph itself for comparison legends).
         :return root: svg node which will be the root for all other elements."""
         graph_width = 50 + self.no_seasons * self.x_inc
         # Main <svg> node
         root = etree.Element(
             "svg",
-            attrib={"version": "1.1", "width": str(graph_width), "height": str(500), "style": "font-family: Arial;"},
+            attrib={"version": "1.1", "width": str(graph_width), "height": str(height), "style": "font-family: Arial;"},
             nsmap={None: "http://www.w3.org/2000/svg", "xlink": "http://www.w3.org/1999/xlink"},
         )
         # White background
-        etree.SubElement(
-            root, "rect",
-            attrib={"width": str(graph_width), "height": str(500), "style": "fill: white;"}
-        )
+        if fill:
+            etree.SubElement(
+                root, "rect",
+                attrib={"width": str(graph_width), "height": str(height), "style": "fill: white;"}
+            )
         # Graph title
-        title = etree.SubElement(
-            root, "text",
-            attrib={"x": str((self.no_seasons * self.x_inc + 39) / 2), "y": str(45), "fill": "#000000", "style": "font-size: 30px; text-anchor: middle"},
-        )
-        q = "\"" if derby else ""
-        s = "s" if derby else ""
-        title.text = f"{q}{full_name}{q} League Performance{s} 1939 – {1938 + self.no_seasons}"
+        if title:
+            title_text = etree.SubElement(
+                root, "text",
+                attrib={"x": str((self.no_seasons * self.x_inc + 39) / 2), "y": str(45), "fill": "#000000", "style": "font-size: 30px; text-anchor: middle"},
+            )
+            q = "\"" if derby else ""
+            s = "s" if derby else ""
+            title_text.text = f"{q}{full_name}{q} League Performance{s} 1939 – {1938 + self.no_seasons}"
 
         return root
 
@@ -190,70 +325,70 @@ class GraphGenerator(object):
 
         # Generate tiers
         for i in reversed(range(self.pyramid_size)):
-            data = [self.league_sizes[year][i] for year in self.league_sizes]
-            d = f"M39,69v{data[0] * self.y_inc}"
-            x_acc = self.x_inc
-
-            for x in range(1, len(data)):
-                if data[x] == data[x-1]:
-                    x_acc += self.x_inc
-                    continue
-
-                d += f"h{x_acc}v{(data[x] - data[x-1]) * self.y_inc}"
-                x_acc = self.x_inc
-
-            d += f"h{x_acc}v{data[-1] * self.y_inc * -1}z"
-
             etree.SubElement(
                 root, "path",
-                attrib={"d": d, "fill": self.tier_colors[i]}
+                attrib={"d": self.geometry.tier_paths[i], "fill": self.tier_colors[i]}
             )
 
         # Outline and year/position markers
-        no_year_marks = (self.no_seasons - 1)
-        no_position_marks = len(range(11, self.max_depth, 10))
-        year_lines = f"M45,{self.y_max + 69.5}v6{no_year_marks * 'm12-6v6'}"
-        posi_lines = f"M32.5,71h6{no_position_marks * 'm-6,50h6'}"
-        outline_path = f"M39,69h{self.x_max}v{self.y_max}H39z{year_lines}{posi_lines}"
         etree.SubElement(
             root, "path",
-            attrib={"d": outline_path, "width": str(1), "fill": "none", "stroke": "#b3b3b3"},
+            attrib={"d": self.geometry.outline_path, "width": str(1), "fill": "none", "stroke": "#b3b3b3"},
         )
 
         # 5-year markers
-        fiveyear_mark = f"m60-{self.y_max - 1}v{self.y_max - 1}"
-        no_fiveyear_marks = (self.no_seasons - 2) // 5
-        fiveyear_path = f"M57,69.5v{self.y_max - 1}{no_fiveyear_marks * fiveyear_mark}"
         etree.SubElement(
             root, "path",
-            attrib={"d": fiveyear_path, "stroke-width": str(1), "stroke-width": str(0.5), "fill": "none", "stroke": "#ffffff"},
+            attrib={"d": self.geometry.fiveyear_path, "stroke-width": str(1), "stroke-width": str(0.5), "fill": "none", "stroke": "#ffffff"},
         )
 
-    def get_plot_line(self, root : etree._Element, club_info : dict):
+    def get_plot_line(self, root : etree._Element, club_info : dict, id_prefix : str | None = None):
         """Construct league position plot line (or lines, depending on data continuity).
         Due to gaps on the source material (relegation to non-national division, missing data, etc.),
         there may be the need of having more than one line to show these gaps.
         If from one season to the next a club jumps over one division this means an administrative
         promotion/relegation (cf. Caso Mateus or Apito Dourado); these cases are drawn as dotted lines.
+        The elements of clubs also drawn in derbies are built once per run and copied into each graph.
 
         :param root: Root svg node to which to append the elements generated here.
-        :param club_info: Club informations gathered from source material."""
-        root.append(etree.Comment(club_info["full_name"]))
-
-        short_name = club_info["short_name"]
+        :param club_info: Club informations gathered from source material.
+        :param id_prefix: Prefix of the plot lines' element ids, unique within the document; defaults to the club's short name."""
+        id_prefix = id_prefix or club_info["short_name"]
+        fragments = self.plot_line_fragments.get(club_info["full_name"], {})
+        if id_prefix in fragments:
+            root.extend(copy.deepcopy(element) for element in fragments[id_prefix])
+            return
+
+        fragment = [etree.Comment(club_info["full_name"])]
         line_type = club_info["line_type"]
         line_color = club_info["line_color"]
+
+        for plot_no, (plotted_line, discontinuous) in enumerate(self.get_plot_line_paths(club_info), 1):
+            fragment.append(self.get_finished_plot_line(line_color, line_type, id_prefix, plot_no, plotted_line, discontinuous))
+
+        if club_info["full_name"] in self.cached_clubs:
+            self.plot_line_fragments.setdefault(club_info["full_name"], {})[id_prefix] = fragment
+            root.extend(copy.deepcopy(element) for element in fragment)
+        else:
+            root.extend(fragment)
+
+    def get_plot_line_paths(self, club_info : dict) -> list[tuple[str, bool]]:
+        """Compute the path strings of a club's plot line, split on data gaps and administrative jumps (see get_plot_line).
+
+        :param club_info: Club informations gathered from source material.
+        :return output: List of (path string, whether the path is a dotted administrative jump), in drawing order."""
         club_data = club_info["data"]
         overall = [club_data[year]["overall"] for year in club_data]
         position_league = [club_data[year]["position"] for year in club_data]
         league = [club_data[year]["league"] for year in club_data]
+        x, y = self.geometry.x, self.geometry.y
 
-        plotted_line, on, plot_no = "", False, 1
+        output, plotted_line, on = [], "", False
 
         for i in range(len(overall)):
             if not on:
                 if overall[i] != -1 and position_league[i] != -1:
-                    plotted_line = f"M{45 + i * self.x_inc},{overall[i] * self.y_inc + 66}"
+                    plotted_line = f"M{x[i]},{y[overall[i]]}"
                     on = True
 
                     if overall[i + 1] == -1 and position_league[i + 1] == -1:
@@ -262,14 +397,12 @@ class GraphGenerator(object):
             else:
                 # Administrative drop/raise of more then 1 division (i.e. Boavista or Gil Vicente)
                 if abs(league[i - 1] - league[i]) > 1 and overall[i] != -1 and position_league[i] != -1:
-                    root.append(self.get_finished_plot_line(line_color, line_type, short_name, plot_no, plotted_line))
-                    plot_no += 1
+                    output.append((plotted_line, False))
 
-                    plotted_line = f"M{45 + (i - 1) * self.x_inc},{overall[i - 1] * self.y_inc + 66}l{self.x_inc},{(overall[i] - overall[i - 1]) * self.y_inc}"
-                    root.append(self.get_finished_plot_line(line_color, line_type, short_name, plot_no, plotted_line, discontinuous=True))
-                    plot_no += 1
+                    plotted_line = f"M{x[i - 1]},{y[overall[i - 1]]}l{self.x_inc},{(overall[i] - overall[i - 1]) * self.y_inc}"
+                    output.append((plotted_line, True))
 
-                    plotted_line = f"M{45 + i * self.x_inc},{overall[i] * self.y_inc + 66}"
+                    plotted_line = f"M{x[i]},{y[overall[i]]}"
 
                     if overall[i+1] == -1 and position_league[i + 1] == -1:
                         plotted_line += "z"
@@ -278,12 +411,13 @@ class GraphGenerator(object):
                     plotted_line += f"l{self.x_inc},{(overall[i] - overall[i - 1]) * self.y_inc}"
 
                 else:
-                    root.append(self.get_finished_plot_line(line_color, line_type, short_name, plot_no, plotted_line))
-                    plot_no += 1
+                    output.append((plotted_line, False))
                     on = False
 
         if on:
-            root.append(self.get_finished_plot_line(line_color, line_type, short_name, plot_no, plotted_line))
+            output.append((plotted_line, False))
+
+        return output
 
     def get_finished_plot_line(self, line_color : list, line_type : str, short_name : str, plot_no : int, plotted_line : str, discontinuous=False) -> etree._Element:
         """Generate path element representing a league position evolution for a club.
@@ -360,6 +494,53 @@ class GraphGenerator(object):
         )
         club_legend.text = club_info["full_name"]
 
+    def get_batched_plot_lines(self, root : etree._Element, clubs : list[dict], legend_lines : list[str] | None = None):
+        """Construct the plot lines of many clubs at once: every segment of the clubs sharing a line style
+        (type and colors) is drawn as a subpath of a single path, so the number of elements grows with
+        the number of distinct styles instead of the number of clubs and segments.
+
+        :param root: Root svg node to which to append the elements generated here.
+        :param clubs: Club informations of the plotted clubs, in drawing order.
+        :param legend_lines: Optional legend sample path for each club, drawn with the club's style."""
+        styles = {}
+        for i, club_info in enumerate(clubs):
+            key = (club_info["line_type"], *club_info["line_color"])
+            style = styles.setdefault(key, {"club_info": club_info, "paths": [], "discontinuous_paths": []})
+            for plotted_line, discontinuous in self.get_plot_line_paths(club_info):
+                style["discontinuous_paths" if discontinuous else "paths"].append(plotted_line)
+            if legend_lines:
+                style["paths"].append(legend_lines[i])
+
+        for style_no, style in enumerate(styles.values()):
+            club_info = style["club_info"]
+            for plot_no, (paths, discontinuous) in enumerate(((style["paths"], False), (style["discontinuous_paths"], True)), 1):
+                if paths:
+                    root.append(self.get_finished_plot_line(club_info["line_color"], club_info["line_type"], f"style{style_no}_", plot_no, "".join(paths), discontinuous))
+
+    def get_comparison_legend(self, root : etree._Element, clubs : list[dict], top : int) -> list[str]:
+        """Lay out the legend of a comparison graph as columns below the graph and add the club names.
+
+        :param root: Root svg node to which to append the elements generated here.
+        :param clubs: Club informations of the plotted clubs.
+        :param top: y coordinate where the legend panel starts.
+        :return legend_lines: Legend sample path for each club, to be drawn with the plot lines."""
+        columns = self.get_comparison_legend_columns()
+        legend_lines = []
+        for i, club_info in enumerate(clubs):
+            x = 45 + (i % columns) * self.legend_column_width
+            y = top + (i // columns) * self.legend_row_height
+            legend_lines.append(f"M{x},{y}h24")
+            club_legend = etree.SubElement(
+                root, "text",
+                attrib={"x": str(x + 32), "y": str(y + 4), "fill": "#000000", "text-anchor": "start", "style": "font-size: 12px"},
+            )
+            club_legend.text = club_info["full_name"]
+        return legend_lines
+
+    def get_comparison_legend_columns(self) -> int:
+        """Number of legend columns fitting the graph width"""
+        return max(1, (self.no_seasons * self.x_inc) // self.legend_column_width)
+
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
     #                                 FILE GENERATORS                                 #
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
@@ -369,12 +550,10 @@ class GraphGenerator(object):
 
         :param club_info: Club information of the plotted club."""
         full_name = club_info["full_name"]
-        root = self.get_svg_body(full_name)
-        self.get_background(root)
-        self.get_plot_line(root, club_info)
-
-        file_path = self.get_output_file_path(club_info["short_name"])
-        self.write_tree_to_file(root, file_path)
+        with self.profiler.subject("club", full_name):
+            root = self.get_club_tree(club_info)
+            file_path = self.get_output_file_path(club_info["short_name"])
+            self.write_tree_to_file(root, file_path)
         logger.info(f"Generated graph for {full_name}")
 
     def generate_file_derby(self, derby : dict, club_info : dict):
@@ -385,55 +564,193 @@ class GraphGenerator(object):
         :param derby: Dictionary with information regarding the teams to be plotted.
         :param club_info: Dictionary containing the club information of the plotted clubs, jeyed by club name."""
         full_name = derby["full_name"] or " vs ".join(derby["clubs"])
-        short_name = self._get_short_name(full_name, True)
+        with self.profiler.subject("derby", full_name):
+            root = self.get_derby_tree(derby, club_info)
+            file_path = self.get_output_file_path(derby["short_name"], True)
+            self.write_tree_to_file(root, file_path)
+        logger.info(f"Generated graph for {full_name}")
+
+    def get_club_tree(self, club_info : dict) -> etree._Element:
+        """Build the SVG document of a club's graph (see generate_file).
 
-        root = self.get_svg_body(full_name, True)
-        self.get_background(root)
+        :param club_info: Club information of the plotted club.
+        :return root: svg element of the document."""
+        root = self.get_svg_body(club_info["full_name"])
+        with self.profiler.stage("background"):
+            self.get_background(root)
+        with self.profiler.stage("plot_lines"):
+            self.get_plot_line(root, club_info)
+        return root
 
-        for plot_no, club in enumerate(derby["clubs"][::-1]):
-            self.get_plot_line(root, club_info[club])
-            self.get_plot_line_legend(root, club_info[club], plot_no)
+    def get_derby_tree(self, derby : dict, club_info : dict) -> etree._Element:
+        """Build the SVG document of a derby's graph (see generate_file_derby).
 
-        file_path = self.get_output_file_path(short_name, True)
-        self.write_tree_to_file(root, file_path)
-        logger.info(f"Generated graph for {full_name}")
+        :param derby: Dictionary with the derby's full_name (may be empty) and clubs.
+        :param club_info: Dictionary containing the club information of the plotted clubs, keyed by club name.
+        :return root: svg element of the document."""
+        root = self.get_svg_body(derby["full_name"] or " vs ".join(derby["clubs"]), True)
+        with self.profiler.stage("background"):
+            self.get_background(root)
 
-    def get_output_file_path(self, short_name : str, derby=False) -> str:
+        with self.profiler.stage("plot_lines"):
+            for plot_no, club in enumerate(derby["clubs"][::-1]):
+                self.get_plot_line(root, club_info[club])
+                self.get_plot_line_legend(root, club_info[club], plot_no)
+        return root
+
+    def generate_file_comparison(self, full_name : str, clubs : list[dict]):
+        """Generate a SVG file comparing any number of clubs' league position evolution through the seasons,
+        with the plot lines batched by line style and the legend in columns below the graph.
+        Also generates a PNG rendering of the SVG file for sharing.
+
+        :param full_name: Title of the comparison.
+        :param clubs: Club informations of the plotted clubs."""
+        short_name = self._get_short_name(full_name, True)
+        if len(short_name.encode("utf-8")) > MAX_COMPARISON_SHORT_NAME:
+            # Long titles are cut, keeping a hash of the full name so that different comparisons do not collide
+            digest = hashlib.sha1(short_name.encode("utf-8")).hexdigest()[:8]
+            short_name = f"{short_name.encode('utf-8')[:MAX_COMPARISON_SHORT_NAME - 9].decode('utf-8', 'ignore')}_{digest}"
+        with self.profiler.subject("derby", full_name):
+            root = self.get_comparison_tree(full_name, clubs)
+            file_path = self.get_output_file_path(short_name, True, comparison=True)
+            self.write_tree_to_file(root, file_path)
+        logger.info(f"Generated comparison graph for {full_name} ({len(clubs)} clubs)")
+
+    def get_comparison_tree(self, full_name : str, clubs : list[dict]) -> etree._Element:
+        """Build the SVG document of a comparison graph (see generate_file_comparison).
+
+        :param full_name: Title of the comparison.
+        :param clubs: Club informations of the plotted clubs.
+        :return root: svg element of the document."""
+        legend_top = 530
+        legend_rows = -(-len(clubs) // self.get_comparison_legend_columns())
+        height = legend_top + legend_rows * self.legend_row_height
+
+        root = self.get_svg_body(full_name, True, height=height)
+        with self.profiler.stage("background"):
+            self.get_background(root)
+
+        with self.profiler.stage("plot_lines"):
+            legend_lines = self.get_comparison_legend(root, clubs, legend_top)
+            self.get_batched_plot_lines(root, clubs, legend_lines)
+        return root
+
+    def get_output_file_path(self, short_name : str, derby=False, comparison=False) -> str:
         """Generate the file path for the output files.
 
         :param short_name: Sanitized representation of club name.
         :param derby: Whether the SVG is for just one club (False) or multiple (True).
+        :param comparison: Whether the SVG is an arbitrary multi-club comparison.
         :return: Base file path to which the files will be written."""
+        if comparison:
+            return f"graphs_comparisons/{short_name}_League_Performances"
         return f"graphs_{'derbies' if derby else 'clubs'}/{short_name}_League_Performance{'s' if derby else ''}"
 
     def write_tree_to_file(self, root : etree._Element, file_path : str):
-        """Write the generated SVG file and a PNG rendering to the file system.
+        """Write the generated SVG file (compacted and/or gzipped as configured) and, unless disabled,
+        a PNG rendering to the file system. The PNG is rasterized from the in-memory document, not from the written file.
+        Files are replaced atomically, and left untouched when their content is unchanged; the PNG is then
+        not rasterized again either, if it is newer than its SVG (as the rasterize subcommand checks).
 
         :param root: svg element to be written into the file system.
         :param file_path: Base file path to which the files are written."""
-        tree = etree.ElementTree(root)
-        tree.write(f"{file_path}.svg", xml_declaration=True, encoding="utf-8", standalone=False)
-        drawing = svg2rlg(f"{file_path}.svg")
-        renderPM.drawToFile(drawing, f"{file_path}.png", fmt="PNG")
+        svg_path, png_path = f"{file_path}.svg", f"{file_path}.png"
+        with self.profiler.stage("serialization"):
+            data = self.get_svg_data(root)
+        with self.profiler.stage("writing"):
+            svg_written = self.outputs.write(svg_path, data)
+            if self.svgz:
+                self.outputs.write(f"{file_path}.svgz", gzip.compress(data, mtime=0))
+        if self.rasterize:
+            if not svg_written and os.path.exists(png_path) and os.path.getmtime(png_path) >= os.path.getmtime(svg_path):
+                self.outputs.keep(png_path)
+            else:
+                with self.profiler.stage("rasterization"):
+                    png_data = self.rasterizer.render_png(root=root, data=data)
+                self.outputs.write(png_path, png_data)
+
+    def get_svg_data(self, root : etree._Element) -> bytes:
+        """Serialize a generated SVG document, compacting it first in compact mode (which modifies the tree).
+
+        :param root: svg element to be serialized.
+        :return: Serialized document, with its XML declaration."""
+        if self.svg_mode == "compact":
+            compact_svg(root)
+        return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=False)
 
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
     #                                   MAIN METHOD                                   #
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
-    def run(self):
-        """Run the graph generation for all imported clubs and derbies"""
-        logger.info(f"Running graph generation for {len(self.club_info)} clubs")
-        for club in self.club_info.values():
-            self.generate_file(club)
-
-        logger.info(f"Running graph generation for {len(self.derbies)} derbies")
-        for derby in self.derbies:
-            self.generate_file_derby(derby, self.club_info)
-
+    def run(self, clubs : bool = True, derbies : bool = True, names : list[str] | None = None):
+        """Run the graph generation for all imported clubs and derbies.
+        In streaming mode, the clubs are read from the workbook in batches and dropped once rendered,
+        so only the derby clubs are kept in memory for the whole run.
+
+        :param clubs: Whether to generate the single club graphs.
+        :param derbies: Whether to generate the derby graphs.
+        :param names: If set, only generate the graphs of these clubs and of the derbies containing them."""
+        self.outputs.reset()
+        schedule, last_use = [], {}
+        if derbies:
+            derby_list = [derby for derby in self.derbies if not names or any(club in names for club in derby["clubs"])]
+            # Each derby club's plot line elements are built once (possibly for its own club graph) and copied
+            # into every derby it appears in, then dropped after the last of them
+            schedule, last_use = self.derby_catalogue.get_schedule(derby_list)
+            self.cached_clubs = set(last_use)
+
+        if clubs and self.streaming:
+            logger.info(f"Running streaming graph generation for {len(names or self.club_names)} clubs")
+            for club in self.iter_club_info(names, self.stream_batch_size):
+                self.generate_file(club)
+                self.check_memory()
+
+        elif clubs:
+            club_list = [club for name, club in self.club_info.items() if not names or name in names]
+            logger.info(f"Running graph generation for {len(club_list)} clubs")
+            for club in club_list:
+                self.generate_file(club)
+                self.check_memory()
+
+        if derbies:
+            logger.info(f"Running graph generation for {len(schedule)} derbies")
+            for i, derby in enumerate(schedule):
+                self.generate_file_derby(derby, self.club_info)
+                for club in derby["clubs"]:
+                    if last_use[club] == i:
+                        self.plot_line_fragments.pop(club, None)
+                        self.cached_clubs.discard(club)
+                self.check_memory()
+
+        if self.streaming:
+            self.wb.close()
+        self.outputs.log_summary()
+        if self.archive_path:
+            self.outputs.write_archive(self.archive_path)
         logger.info("Finished graph generation for clubs and derbies")
+        self.profiler.stop()
+        self.profiler.log_summary()
 
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
     #                              GENERIC HELPER METHODS                             #
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    def check_memory(self):
+        """Abort the run if the process memory exceeds the [streaming] max_memory_mb ceiling (if set)"""
+        if not self.max_memory_mb or get_memory_usage() <= self.max_memory_mb:
+            return
+        gc.collect()
+        memory_usage = get_memory_usage()
+        if memory_usage > self.max_memory_mb:
+            raise MemoryError(f"Memory usage of {memory_usage:.0f}MiB exceeds the configured ceiling of {self.max_memory_mb:.0f}MiB")
+
+    def get_clubs_in_tier(self, tier : int) -> list[dict]:
+        """Club informations of every club which played at least one season in the given tier.
+
+        :param tier: League tier (1 being the top flight)."""
+        return [
+            club_info for club_info in self.club_info.values()
+            if any(season["league"] == tier for season in club_info["data"].values())
+        ]
+
     def _get_short_name(self, name : str, derby=False) -> str:
         """Sanatize club name to be more "web friendly" (no diacritics nor spaces).
 
@@ -442,3 +759,14 @@ class GraphGenerator(object):
             Relevant since in those cases we want spaces to be replaced by underscores.
         :return: Sanatised string."""
         return unidecode(name.replace(" ", "_" if derby else "").replace(".", "").replace("-", ""))
+
+
+def rasterize_file(file_path : str, rasterizer : Rasterizer | None = None):
+    """Render the SVG file at file_path.svg into a PNG at file_path.png.
+    Module-level so that it can be dispatched to worker processes.
+
+    :param file_path: Base file path of the SVG file, without extension.
+    :param rasterizer: Backend to render with; the reportlab one if not set."""
+    rasterizer = rasterizer or get_rasterizer()
+    with open(f"{file_path}.svg", "rb") as fp:
+        write_file_atomic(f"{file_path}.png", rasterizer.render_png(data=fp.read()))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from os import path
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+
+# Entry points whose cold-start cost is tracked
+TARGETS = ("modules.main", "modules.graph_generator", "modules.db_connector")
+
+
+def measure_import_time(module : str, repeat : int = 3) -> dict:
+    """Import a module in fresh interpreters with -X importtime and keep the fastest run.
+
+    :param module: Dotted module name, importable from the league_graphs directory.
+    :param repeat: Number of fresh interpreters to run.
+    :return: Dictionary with the total cumulative time (us) and the self time summed per top-level package."""
+    best = None
+    for _ in range(repeat):
+        env = {**os.environ, "PYTHONPATH": ROOT_DIR, "PYTHONDONTWRITEBYTECODE": ""}
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, env=env, cwd=ROOT_DIR,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Unable to import {module}:\n{result.stderr}")
+
+        packages, total = {}, 0
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            self_time, cumulative, name = line[len("import time:"):].split("|")
+            # Only top-level entries (no leading indentation) add up to the total
+            if not name.startswith("  "):
+                total += int(cumulative)
+            top_level = name.strip().split(".")[0]
+            packages[top_level] = packages.get(top_level, 0) + int(self_time)
+
+        if best is None or total < best["total_us"]:
+            best = {"total_us": total, "packages": packages}
+    return best
+
+
+def run_benchmark(targets : tuple[str] = TARGETS, repeat : int = 3) -> dict:
+    """Measure every target entry point"""
+    return {module: measure_import_time(module, repeat) for module in targets}
+
+
+def format_report(results : dict, baseline : dict | None = None, top : int = 8) -> str:
+    """Render the benchmark results, with deltas against a previous run if given"""
+    lines = []
+    for module, result in results.items():
+        total_ms = result["total_us"] / 1000
+        delta = ""
+        if baseline and module in baseline:
+            delta = f" ({total_ms - baseline[module]['total_us'] / 1000:+.1f}ms vs baseline)"
+        lines.append(f"{module}: {total_ms:.1f}ms{delta}")
+        heaviest = sorted(result["packages"].items(), key=lambda item: item[1], reverse=True)[:top]
+        for package, cumulative in heaviest:
+            lines.append(f"  {cumulative / 1000:>8.1f}ms  {package}")
+    return "\n".join(lines)
+
+
+def main(argv : list[str] | None = None):
+    """Cold-start import benchmark based on `python -X importtime`.
+    Run from the league_graphs directory with `python -m modules.import_benchmark`."""
+    parser = argparse.ArgumentParser(description="Measure cold-start import cost of the league_graphs entry points")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per entry point (fastest is kept)")
+    parser.add_argument("--baseline", help="JSON file from a previous --output to compare against")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(repeat=args.repeat)
+    baseline = None
+    if args.baseline and path.exists(args.baseline):
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+    print(format_report(results, baseline))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import copy
+import json
+import logging
+import queue
+
+# Listener started by start_queue_logging, whose handlers worker processes write to directly
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line.
+    Can also be referenced from logging.conf as class=modules.logging_queue.JsonFormatter"""
+    def format(self, record : logging.LogRecord) -> str:
+        """Serialize the record's time, logger name, level and message (plus exception, if any)"""
+        output = {
+            "time": self.formatTime(record),
+            "name": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            output["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            output["exception"] = record.exc_text
+        return json.dumps(output, ensure_ascii=False)
+
+
+class RecordQueueHandler(QueueHandler):
+    """QueueHandler leaving all formatting to the listener's handlers. The stock prepare() renders the
+    traceback into the message and drops exc_info, which JsonFormatter then cannot put under its own key;
+    here the message is only merged with its arguments, as the queue never leaves the process."""
+    def prepare(self, record : logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+
+class RecordQueueListener(QueueListener):
+    """QueueListener which can be stopped more than once (explicitly, then again at interpreter exit)"""
+    running = False
+
+    def start(self):
+        super().start()
+        self.running = True
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            super().stop()
+
+
+def start_queue_logging(logger : logging.Logger, json_output : bool = False) -> QueueListener:
+    """Move the logger's handlers behind a QueueHandler drained by a background QueueListener,
+    so that logging calls no longer block on terminal or disk writes.
+
+    :param logger: Logger (usually root) whose handlers were configured from logging.conf.
+    :param json_output: Whether to replace the handlers' formatters with JsonFormatter.
+    :return listener: Started listener, which is also stopped (and flushed) at interpreter exit."""
+    global _listener
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        if json_output:
+            handler.setFormatter(JsonFormatter())
+        logger.removeHandler(handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(RecordQueueHandler(log_queue))
+    listener = RecordQueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    _listener = listener
+    return listener
+
+
+def init_worker_logging():
+    """Initializer of worker processes forked from a process logging through a queue: no listener thread
+    drains the queue in the worker, so its records go straight to the listener's handlers instead"""
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+            if _listener is not None:
+                for listener_handler in _listener.handlers:
+                    logger.addHandler(listener_handler)
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
-from modules import db_connector, graph_generator
+from modules.logging_queue import init_worker_logging, start_queue_logging
 from dotenv import load_dotenv
 from os import path
+import argparse
 import configparser
+import glob
 import logging
 import logging.config
 
@@ -10,18 +12,350 @@ ROOT_DIR = path.abspath("league_graphs")
 ENV_CONFIG_PATH = "config/.env"
 CONFIG_PATH = "config/league_graphs.conf"
 LOGGER_CONFIG_PATH = "config/logging.conf"
+DEFAULT_ARTIFACT_PATH = "cache/league_graphs.json"
+# Longest default comparison title (clubs joined with " vs "), beyond which "<N> clubs" is used instead
+COMPARISON_TITLE_LENGTH = 60
 
 
-def main():
+def main(argv : list[str] | None = None):
+    """Command line entry point; without a subcommand, runs the whole pipeline (the "run" subcommand)"""
+    args = get_parser().parse_args(argv)
     load_dotenv(path.join(ROOT_DIR, ENV_CONFIG_PATH))
     config = get_config()
-    logger = get_logger()
+    logger = get_logger(config)
+    args.func(args, config)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Build the command line parser with one subcommand per pipeline stage"""
+    parser = argparse.ArgumentParser(prog="league_graphs", description="Portuguese league performance graphs")
+    parser.set_defaults(func=run_all)
+    subparsers = parser.add_subparsers(title="subcommands")
+
+    parser_run = subparsers.add_parser("run", help="initialize the database and generate every SVG and PNG (default)")
+    parser_run.add_argument("--streaming", action="store_true", default=None, help="render clubs while reading the workbook, keeping only derby clubs in memory")
+    parser_run.set_defaults(func=run_all)
+
+    parser_ingest = subparsers.add_parser("ingest", help="parse the workbook into the ingestion artifact")
+    parser_ingest.add_argument("--artifact", help="path of the ingestion artifact to write")
+    parser_ingest.set_defaults(func=run_ingest)
+
+    parser_render = subparsers.add_parser("render-svg", help="write SVG files from the ingestion artifact")
+    parser_render.add_argument("--artifact", help="path of the ingestion artifact to read")
+    parser_render.add_argument("--club", action="append", dest="clubs", help="only render this club and its derbies (repeatable)")
+    group_render = parser_render.add_mutually_exclusive_group()
+    group_render.add_argument("--clubs-only", action="store_true", help="skip the derby graphs")
+    group_render.add_argument("--derbies-only", action="store_true", help="skip the single club graphs")
+    parser_render.set_defaults(func=run_render_svg)
+
+    parser_compare = subparsers.add_parser("compare", help="render one graph comparing any number of clubs")
+    parser_compare.add_argument("--artifact", help="path of the ingestion artifact to read")
+    parser_compare.add_argument("--club", action="append", dest="clubs", default=[], help="club to include (repeatable)")
+    parser_compare.add_argument("--tier", type=int, help="include every club which ever played in this tier")
+    parser_compare.add_argument("--title", help="graph title (defaults to the club names or the tier)")
+    parser_compare.add_argument("--no-png", action="store_true", help="only write the SVG file")
+    parser_compare.set_defaults(func=run_compare)
+
+    parser_rasterize = subparsers.add_parser("rasterize", help="render PNG files from the existing SVG files")
+    parser_rasterize.add_argument("--jobs", type=int, default=1, help="number of worker processes")
+    parser_rasterize.add_argument("--force", action="store_true", help="also render PNG files newer than their SVG")
+    parser_rasterize.add_argument("--rasterizer", help="backend (reportlab, cairosvg, rsvg or auto); defaults to [output] rasterizer")
+    parser_rasterize.set_defaults(func=run_rasterize)
+
+    parser_batch = subparsers.add_parser("batch-png", help="export club PNG files over a shared pre-rasterized background")
+    parser_batch.add_argument("--artifact", help="path of the ingestion artifact to read")
+    parser_batch.add_argument("--club", action="append", dest="clubs", help="only export this club (repeatable)")
+    parser_batch.add_argument("--sheet", help="pack all clubs into this tiled PNG (plus a .json index) instead of one file per club")
+    parser_batch.add_argument("--columns", type=int, default=0, help="tiles per sheet row (default: square sheet)")
+    parser_batch.add_argument("--tile-scale", type=float, default=1.0, help="scale of each sheet tile")
+    parser_batch.set_defaults(func=run_batch_png)
+
+    parser_watch = subparsers.add_parser("watch", help="re-render the graphs of the clubs changed whenever the workbook is saved")
+    parser_watch.add_argument("--interval", type=float, default=0.5, help="seconds between two checks of the workbook")
+    parser_watch.add_argument("--no-png", action="store_true", help="only write the SVG files")
+    parser_watch.set_defaults(func=run_watch)
+
+    parser_serve = subparsers.add_parser("serve", help="serve club and derby graphs over HTTP, rendered on demand")
+    parser_serve.add_argument("--artifact", help="path of the ingestion artifact to read")
+    parser_serve.add_argument("--host", help="address to listen on; defaults to [server] host")
+    parser_serve.add_argument("--port", type=int, help="port to listen on; defaults to [server] port")
+    parser_serve.set_defaults(func=run_serve)
+
+    parser_stats = subparsers.add_parser("stats", help="compute derived club and derby statistics from the ingestion artifact")
+    parser_stats.add_argument("--artifact", help="path of the ingestion artifact to read")
+    parser_stats.add_argument("--output", default="stats", help="directory of the CSV and JSON files (default: stats)")
+    parser_stats.add_argument("--db", action="store_true", help="also replace the statistics tables of the database")
+    parser_stats.set_defaults(func=run_stats)
+
+    parser_check = subparsers.add_parser("check-rasterizer", help="pixel-diff a rasterizer backend against the reportlab output")
+    parser_check.add_argument("rasterizer", help="backend to check (cairosvg, rsvg or auto)")
+    parser_check.add_argument("--tolerance", type=float, default=2.0, help="maximum mean channel difference (0-255)")
+    parser_check.set_defaults(func=run_check_rasterizer)
+
+    parser_snapshots = subparsers.add_parser("snapshots", help="check the graphs of synthetic workbooks against the stored snapshots")
+    parser_snapshots.add_argument("--update", action="store_true", help="replace the stored snapshots with the rendered graphs")
+    parser_snapshots.add_argument("--png", action="store_true", help="also compare PNG thumbnails")
+    parser_snapshots.add_argument("--tolerance", type=float, default=1.0, help="maximum mean channel difference of PNG thumbnails (0-255)")
+    parser_snapshots.add_argument("--jobs", type=int, default=0, help="number of worker processes (default: number of CPUs)")
+    parser_snapshots.add_argument("--scenario", action="append", help="only run this scenario (repeatable)")
+    parser_snapshots.set_defaults(func=run_snapshots)
+
+    parser_check_logging = subparsers.add_parser("check-logging", help="check that queued JSON logging keeps tracebacks under their own key")
+    parser_check_logging.set_defaults(func=run_check_logging)
+
+    parser_init_db = subparsers.add_parser("init-db", help="create the database, its user and the model tables")
+    parser_init_db.set_defaults(func=run_init_db)
+
+    parser_load_db = subparsers.add_parser("load-db", help="load the ingestion artifact into the database")
+    parser_load_db.add_argument("--artifact", help="path of the ingestion artifact to read")
+    parser_load_db.set_defaults(func=run_load_db)
+
+    return parser
+
+
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+#                                   SUBCOMMANDS                                   #
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+def run_all(args : argparse.Namespace, config : dict):
+    """Initialize the database and run the whole graph generation straight from the workbook"""
+    from modules import db_connector, graph_generator
     db = db_connector.DBConnector(config)
-    generator = graph_generator.GraphGenerator()
+    generator = graph_generator.GraphGenerator(config, streaming=getattr(args, "streaming", None))
     generator.run()
     db.close()
 
 
+def run_ingest(args : argparse.Namespace, config : dict):
+    """Parse the workbook and write the ingestion artifact"""
+    from modules import graph_generator
+    generator = graph_generator.GraphGenerator(config, streaming=False)
+    generator.dump_artifact(get_artifact_path(args, config))
+
+
+def run_render_svg(args : argparse.Namespace, config : dict):
+    """Write the SVG files (no PNG) using the ingestion artifact"""
+    from modules import graph_generator
+    generator = graph_generator.GraphGenerator(config, artifact_path=get_artifact_path(args, config))
+    generator.rasterize = False
+    generator.run(clubs=not args.derbies_only, derbies=not args.clubs_only, names=args.clubs)
+
+
+def run_compare(args : argparse.Namespace, config : dict):
+    """Render a single comparison graph for the selected clubs"""
+    from modules import graph_generator
+    generator = graph_generator.GraphGenerator(config, artifact_path=get_artifact_path(args, config))
+    generator.rasterize = not args.no_png
+
+    unknown = [name for name in args.clubs if name not in generator.club_info]
+    if unknown:
+        raise SystemExit(f"Unknown club(s): {', '.join(unknown)}")
+    clubs = [generator.club_info[name] for name in args.clubs]
+    if args.tier:
+        clubs += [club_info for club_info in generator.get_clubs_in_tier(args.tier) if club_info not in clubs]
+    if not clubs:
+        raise SystemExit("No clubs selected, use --club and/or --tier")
+
+    title = args.title or (f"Tier {args.tier} clubs" if args.tier else " vs ".join(club_info["full_name"] for club_info in clubs))
+    if not args.title and len(title) > COMPARISON_TITLE_LENGTH:
+        title = f"{len(clubs)} clubs"
+    generator.generate_file_comparison(title, clubs)
+    generator.profiler.stop()
+    generator.profiler.log_summary()
+
+
+def run_rasterize(args : argparse.Namespace, config : dict):
+    """Render a PNG for every SVG file in the output directories, in parallel if requested"""
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    from modules import graph_generator
+    from modules.rasterizers import get_rasterizer
+    rasterizer = get_rasterizer(args.rasterizer or (config.get("output") or {}).get("rasterizer", "reportlab"))
+    file_paths = []
+    for svg_path in get_svg_paths():
+        file_path = svg_path[:-len(".svg")]
+        png_path = f"{file_path}.png"
+        if args.force or not path.exists(png_path) or path.getmtime(png_path) < path.getmtime(svg_path):
+            file_paths.append(file_path)
+
+    logging.getLogger(__name__).info(f"Rasterizing {len(file_paths)} SVG files with {args.jobs} job(s) using {rasterizer.name}")
+    rasterize_file = partial(graph_generator.rasterize_file, rasterizer=rasterizer)
+    if args.jobs > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker_logging) as executor:
+            list(executor.map(rasterize_file, file_paths, chunksize=8))
+    else:
+        for file_path in file_paths:
+            rasterize_file(file_path)
+
+
+def run_batch_png(args : argparse.Namespace, config : dict):
+    """Export club PNG files, or a tiled sheet of them, rasterizing the shared background only once"""
+    from modules import graph_generator
+    from modules.batch_export import BatchExporter
+    generator = graph_generator.GraphGenerator(config, artifact_path=get_artifact_path(args, config))
+    clubs = [club for name, club in generator.club_info.items() if not args.clubs or name in args.clubs]
+    exporter = BatchExporter(generator)
+    if args.sheet:
+        exporter.export_sheet(clubs, args.sheet, args.columns, args.tile_scale)
+    else:
+        exporter.export_pngs(clubs)
+    generator.profiler.stop()
+    generator.profiler.log_summary()
+
+
+def run_watch(args : argparse.Namespace, config : dict):
+    """Parse the workbook once, then keep re-rendering the graphs affected by each change to it"""
+    from modules import graph_generator
+    from modules.watcher import WorkbookWatcher
+    generator = graph_generator.GraphGenerator(config, streaming=False)
+    generator.rasterize = not args.no_png
+    WorkbookWatcher(generator, args.interval).watch()
+
+
+def run_serve(args : argparse.Namespace, config : dict):
+    """Serve the graphs over HTTP from the ingestion artifact, keeping the generator warm between requests"""
+    from modules import graph_generator
+    from modules.render_server import serve
+    generator = graph_generator.GraphGenerator(config, artifact_path=get_artifact_path(args, config))
+    config_server = dict(config.get("server") or {})
+    config_server.update({key: value for key, value in (("host", args.host), ("port", args.port)) if value})
+    serve(generator, config_server)
+
+
+def run_stats(args : argparse.Namespace, config : dict):
+    """Compute the derived statistics and export them as CSV and JSON files and, if requested, to the database"""
+    from modules import graph_generator
+    from modules.statistics_engine import StatisticsEngine
+    generator = graph_generator.GraphGenerator(config, artifact_path=get_artifact_path(args, config))
+    engine = StatisticsEngine(generator.club_info, generator.derbies).compute()
+    engine.export_csv(args.output)
+    engine.export_json(path.join(args.output, "statistics.json"))
+    if args.db:
+        from modules import db_connector
+        from modules.models import model
+        with db_connector.DBConnector(config, initialize=False) as db:
+            engine.write_to_database(db.cr, model.configure_models(db.cr))
+
+
+def run_check_rasterizer(args : argparse.Namespace, config : dict):
+    """Rasterize every SVG file with the reference and the given backend and compare the results"""
+    from modules.rasterizers import get_image_difference, get_rasterizer
+    import tempfile
+    logger = logging.getLogger(__name__)
+    reference, candidate = get_rasterizer("reportlab"), get_rasterizer(args.rasterizer)
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reference_png, candidate_png = path.join(tmp_dir, "reference.png"), path.join(tmp_dir, "candidate.png")
+        for svg_path in get_svg_paths():
+            with open(svg_path, "rb") as fp:
+                data = fp.read()
+            reference.render(reference_png, data=data)
+            candidate.render(candidate_png, data=data)
+            difference = get_image_difference(reference_png, candidate_png)
+            if difference > args.tolerance:
+                failures += 1
+                logger.warning(f"{svg_path}: mean difference {difference:.3f} above tolerance {args.tolerance}")
+    logger.info(f"Checked {candidate.name} against {reference.name}: {failures} file(s) above tolerance")
+    if failures:
+        raise SystemExit(1)
+
+
+def run_check_logging(args : argparse.Namespace, config : dict):
+    """Log an exception through a queued JsonFormatter handler, as in [logging] queue mode, and check the output line"""
+    from modules.logging_queue import JsonFormatter, RecordQueueHandler, RecordQueueListener
+    import io
+    import json
+    import queue
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = RecordQueueListener(log_queue, handler)
+    check_logger = logging.getLogger(f"{__name__}.check_logging")
+    check_logger.propagate = False
+    check_logger.addHandler(RecordQueueHandler(log_queue))
+    listener.start()
+    try:
+        raise ValueError("logging check")
+    except ValueError:
+        check_logger.exception("Logged %s", "exception")
+    listener.stop()
+    listener.stop()
+
+    output = json.loads(stream.getvalue())
+    logger = logging.getLogger(__name__)
+    if output["message"] != "Logged exception" or "ValueError: logging check" not in output.get("exception", ""):
+        logger.error(f"Queued JSON logging does not keep the traceback under its own key: {output}")
+        raise SystemExit(1)
+    logger.info("Queued JSON logging keeps the message and the traceback under their own keys")
+
+
+def run_snapshots(args : argparse.Namespace, config : dict):
+    """Render the synthetic scenarios and compare them with (or store them as) the snapshots"""
+    from modules.snapshots import SCENARIOS, SnapshotHarness
+    logger = logging.getLogger(__name__)
+    unknown = set(args.scenario or []) - SCENARIOS.keys()
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))} (expected {', '.join(SCENARIOS)})")
+    harness = SnapshotHarness(args.jobs, args.png, args.tolerance, args.scenario)
+    results = harness.render()
+    if args.update:
+        harness.update(results)
+        return
+    failures = harness.check(results)
+    for failure in failures:
+        logger.warning(failure)
+    logger.info(f"Checked {len(results)} snapshot(s): {len(failures)} failure(s)")
+    if failures:
+        raise SystemExit(1)
+
+
+def run_init_db(args : argparse.Namespace, config : dict):
+    """Create the database and its user if needed, and configure the model tables"""
+    from modules import db_connector
+    from modules.models import model
+    with db_connector.DBConnector(config) as db:
+        model.configure_models(db.cr)
+
+
+def run_load_db(args : argparse.Namespace, config : dict):
+    """Replace the club and club_season tables' contents with the ingestion artifact's data, in a single transaction"""
+    from modules import db_connector, graph_generator
+    from modules.models import model
+    generator = graph_generator.GraphGenerator(config, artifact_path=get_artifact_path(args, config))
+    with db_connector.DBConnector(config, initialize=False) as db:
+        models = model.configure_models(db.cr)
+        club_model, season_model = models["club"], models["club_season"]
+        try:
+            season_model.truncate(db.cr, commit=False)
+            club_model.truncate(db.cr, commit=False)
+
+            for club_info in generator.club_info.values():
+                club = club_model.create(db.cr, {
+                    "full_name": club_info["full_name"],
+                    "short_name": club_info["short_name"],
+                    "line_type": club_info["line_type"],
+                    "line_color": club_info["line_color"][0],
+                    "line_color_secondary": club_info["line_color"][1],
+                })
+                season_model.create(db.cr, [
+                    {"club_id": club.id, "season": str(season), **values}
+                    for season, values in club_info["data"].items()
+                ])
+        except Exception:
+            # Keep the previously loaded data rather than committing partially filled tables
+            db.cr.connection.rollback()
+            raise
+        db.cr.connection.commit()
+
+
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+#                                 CONFIGURATION                                   #
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+def get_svg_paths() -> list[str]:
+    """SVG files of every output directory (clubs, derbies and comparisons), sorted"""
+    return sorted(glob.glob("graphs_clubs/*.svg") + glob.glob("graphs_derbies/*.svg") + glob.glob("graphs_comparisons/*.svg"))
+
+
 def get_config() -> dict:
     """Parse main configuration file and convert it to a dictionary"""
     config = configparser.ConfigParser()
@@ -29,9 +363,30 @@ def get_config() -> dict:
     return dict(config)
 
 
-def get_logger() -> logging.Logger:
-    """Configure base logger with settings coming from logging.conf"""
+def get_config_bool(config : dict | None, key : str, default : bool) -> bool:
+    """Read a boolean option from a configuration section or plain dictionary"""
+    value = (config or {}).get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "yes", "true", "on")
+
+
+def get_artifact_path(args : argparse.Namespace, config : dict) -> str:
+    """Path of the ingestion artifact: command line option, then [pipeline] artifact_path, then the default"""
+    return getattr(args, "artifact", None) or (config.get("pipeline") or {}).get("artifact_path") or DEFAULT_ARTIFACT_PATH
+
+
+def get_logger(config : dict | None = None) -> logging.Logger:
+    """Configure base logger with settings coming from logging.conf.
+    If the [logging] section of league_graphs.conf enables queue mode, the configured handlers
+    are served by a background thread, optionally writing JSON lines."""
     log_config_path = path.join(ROOT_DIR, LOGGER_CONFIG_PATH)
     logging.config.fileConfig(log_config_path, disable_existing_loggers=False)
     logger = logging.getLogger()
+
+    config_logging = (config or {}).get("logging") or {}
+    if get_config_bool(config_logging, "queue", False):
+        start_queue_logging(logger, get_config_bool(config_logging, "json", False))
     return logger
@@ -1,3 +1,5 @@
 # -*- coding: utf-8 -*-
 from . import model
 from . import fields
+from . import club
+from . import club_statistics
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from . import fields
+from .model import Model
+
+
+class Club(Model):
+    _table = "club"
+
+    full_name = fields.String(required=True)
+    short_name = fields.String(required=True)
+    line_type = fields.String()
+    line_color = fields.String()
+    line_color_secondary = fields.String()
+
+
+class ClubSeason(Model):
+    _table = "club_season"
+
+    club_id = fields.Integer(required=True)
+    season = fields.String(required=True)
+    league = fields.Integer()
+    position = fields.Integer()
+    overall = fields.Integer()
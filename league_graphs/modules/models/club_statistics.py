@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from . import fields
+from .model import Model
+
+
+class ClubStatistics(Model):
+    _table = "club_statistics"
+
+    club_id = fields.Integer(required=True)
+    seasons = fields.Integer()
+    best_overall = fields.Integer()
+    best_season = fields.String()
+    worst_overall = fields.Integer()
+    worst_season = fields.String()
+    promotions = fields.Integer()
+    relegations = fields.Integer()
+    longest_promotion_streak = fields.Integer()
+    longest_relegation_streak = fields.Integer()
+    administrative_jumps = fields.Integer()
+
+
+class ClubTierStatistics(Model):
+    _table = "club_tier_statistics"
+
+    club_id = fields.Integer(required=True)
+    tier = fields.Integer(required=True)
+    seasons = fields.Integer()
+    best_position = fields.Integer()
+    worst_position = fields.Integer()
+
+
+class DerbyStatistics(Model):
+    _table = "derby_statistics"
+
+    derby = fields.String(required=True)
+    club_id = fields.Integer(required=True)
+    shared_seasons = fields.Integer()
+    same_tier_seasons = fields.Integer()
+    best_placed_seasons = fields.Integer()
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from . import fields
+from collections.abc import Generator
+from contextlib import contextmanager
 from typing import overload, Any, Iterable
 from psycopg2 import sql
 import psycopg2
@@ -8,6 +10,38 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+class RowLogging(object):
+    """Controls the per-row INFO success lines of the CRUD methods: every Nth line is logged, none if N is 0"""
+    def __init__(self, sample : int = 1):
+        self.sample = sample
+        self.counter = 0
+
+    def set_sample(self, sample : int):
+        """Log every sample-th per-row line; 1 logs all of them and 0 disables them"""
+        self.sample = max(sample, 0)
+        self.counter = 0
+
+    def is_enabled(self) -> bool:
+        """Whether the next per-row line should be logged (advances the sampling counter)"""
+        if self.sample == 0:
+            return False
+        self.counter += 1
+        return self.sample == 1 or self.counter % self.sample == 1
+
+    @contextmanager
+    def sampled(self, sample : int) -> Generator[None]:
+        """Temporarily change the sampling rate, e.g. for bulk operations"""
+        previous = self.sample
+        self.set_sample(sample)
+        try:
+            yield
+        finally:
+            self.set_sample(previous)
+
+
+row_logging = RowLogging()
+
+
 class MetaModel(type):
     def __new__(cls, name : str, bases : tuple, dct : dict):
         """For each model which inherits a class with MetaModel as its metaclass, adds the elements of the parent classes to __dict__"""
@@ -62,6 +96,10 @@ class Model(metaclass=MetaModel):
         }
         return {"id": fields_dict["id"], **_fields}
 
+    def get_field_names(self) -> list[str]:
+        """Get the names of this model's fields, id included"""
+        return list(self._fields)
+
     def set_fields(self, values : dict[str, Any] = {}):
         """Set this instance's fields given the field name -> field value dictionary in values"""
         for field, value in values.items():
@@ -140,9 +178,11 @@ class Model(metaclass=MetaModel):
             return self._create(cr, values)
         if isinstance(values, Iterable):
             output = []
-            for value in values:
-                obj = self._create(cr, value)
-                output.append(obj)
+            with row_logging.sampled(0):
+                for value in values:
+                    obj = self._create(cr, value)
+                    output.append(obj)
+            logger.info(f"Create {self._table}, {len(output)} rows, success")
             return output
         raise ValueError("The values argument must be either a dictionary or an Iterable of dictionaries")
 
@@ -170,7 +210,8 @@ class Model(metaclass=MetaModel):
         )
         cr.execute(query)
         _id, = cr.fetchone()
-        logger.info(f"Create {self._table}, id = {_id}, success")
+        if row_logging.is_enabled():
+            logger.info(f"Create {self._table}, id = {_id}, success")
         return self.read(cr, _id)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
@@ -227,19 +268,19 @@ class Model(metaclass=MetaModel):
         if single_mode:
             row = cr.fetchone()
             values = self._row_to_dict(header, row)
-            logger.info(f"Read {self._table}, id = {_id}, success")
+            if row_logging.is_enabled():
+                logger.info(f"Read {self._table}, id = {_id}, success")
             return self.__class__(values)
 
         else:
             output = []
-            output_ids = []
             rows = cr.fetchall()
             for row in rows:
                 values = self._row_to_dict(header, row)
                 output.append(self.__class__(values))
-                output_ids.append(values["id"])
-            output_ids_str = ", ".join(map(str, output_ids))
-            logger.info(f"Read {self._table}, id in ({output_ids_str}), success")
+            if row_logging.is_enabled():
+                output_ids_str = ", ".join(str(obj.id) for obj in output)
+                logger.info(f"Read {self._table}, id in ({output_ids_str}), success")
             return output
 
     def _row_to_dict(self, header : list[psycopg2.extensions.Column], row : tuple[Any]) -> dict[str, Any]:
@@ -286,7 +327,8 @@ class Model(metaclass=MetaModel):
             logger.warning(f"Update {self._table}, id = {self.id}, rowcount = 0")
             return False
         self.set_fields(values)
-        logger.info(f"Update {self._table}, id = {self.id}, success")
+        if row_logging.is_enabled():
+            logger.info(f"Update {self._table}, id = {self.id}, success")
         return True
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - #
@@ -314,7 +356,8 @@ class Model(metaclass=MetaModel):
             logger.warning(f"Delete {self._table}, id = {_id}, rowcount = 0")
             return False
         self.set_fields_defaults(self._fields.keys())
-        logger.info(f"Delete {self._table}, id = {_id}, success")
+        if row_logging.is_enabled():
+            logger.info(f"Delete {self._table}, id = {_id}, success")
         return True
 
     # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
@@ -350,6 +393,17 @@ class Model(metaclass=MetaModel):
         ids = [row[0] for row in rows]
         return self.read(cr, ids)
 
+    def truncate(self, cr : psycopg2.extensions.cursor, commit : bool = True):
+        """Delete all records of this model's table, restarting its id sequence.
+
+        :param commit: Whether to commit right away; if not, the caller commits (or rolls back) the transaction,
+            e.g. to replace a table's contents atomically."""
+        query = sql.SQL("TRUNCATE TABLE {table} RESTART IDENTITY").format(table=sql.Identifier(self._table))
+        cr.execute(query)
+        if commit:
+            cr.connection.commit()
+        logger.info(f"Truncate {self._table}, success")
+
     def _domain_to_sql(self, domain : list[str | list | tuple]) -> sql.SQL:
         """"""
         if not domain:
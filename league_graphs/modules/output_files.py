@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+import secrets
+import tarfile
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+# Archive formats by file name suffix
+ARCHIVE_MODES = {".zip": "zip", ".tar": "w", ".tar.gz": "w:gz", ".tgz": "w:gz", ".tar.xz": "w:xz"}
+
+def create_temp_file(file_path : str) -> tuple[int, str]:
+    """Create a new hidden temporary file next to a target file, with the permissions the target would be
+    created with (0666 less the umask, applied by the kernel), unlike tempfile.mkstemp's private 0600.
+
+    :return: Open file descriptor (write only) and path of the temporary file."""
+    directory, file_name = os.path.split(os.path.abspath(file_path))
+    while True:
+        tmp_path = os.path.join(directory, f".{file_name}.{secrets.token_hex(4)}.tmp")
+        try:
+            return os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666), tmp_path
+        except FileExistsError:
+            continue
+
+
+def write_file_atomic(file_path : str, data : bytes):
+    """Write a file through a temporary file in the same directory renamed over the target,
+    so that an interrupted write never leaves a partial file behind.
+
+    :param file_path: Path of the file to be written.
+    :param data: Full content of the file."""
+    fd, tmp_path = create_temp_file(file_path)
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class OutputWriter(object):
+    """Writes a run's output files atomically, skipping those whose content is already on disk
+    (so unchanged graphs keep their modification time), and can pack them into a single archive"""
+    def __init__(self, skip_unchanged : bool = True, keep_paths : bool = False):
+        """:param skip_unchanged: Whether to leave files whose content hash matches the new content untouched.
+        :param keep_paths: Whether to record the run's file paths, as needed by write_archive."""
+        self.skip_unchanged = skip_unchanged
+        self.keep_paths = keep_paths
+        self.reset()
+        # Content hashes of the files checked or written, so that long-running processes do not re-read them
+        self.digests = {}
+
+    def reset(self):
+        """Start a new run: clear the recorded file paths and the written/skipped counts"""
+        self.file_paths = []
+        self.written = 0
+        self.skipped = 0
+
+    def is_unchanged(self, file_path : str, data : bytes) -> bool:
+        """Whether the file on disk already holds exactly this content"""
+        if not self.skip_unchanged:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        if stat.st_size != len(data):
+            return False
+
+        digest = hashlib.sha256(data).digest()
+        key = (stat.st_mtime_ns, stat.st_size)
+        known_key, known_digest = self.digests.get(file_path, (None, None))
+        if known_key != key:
+            with open(file_path, "rb") as fp:
+                known_digest = hashlib.sha256(fp.read()).digest()
+            self.digests[file_path] = (key, known_digest)
+        return digest == known_digest
+
+    def write(self, file_path : str, data : bytes) -> bool:
+        """Write an output file unless its content is unchanged.
+
+        :return: Whether the file was written."""
+        if self.keep_paths:
+            self.file_paths.append(file_path)
+        if self.is_unchanged(file_path, data):
+            self.skipped += 1
+            return False
+
+        write_file_atomic(file_path, data)
+        stat = os.stat(file_path)
+        self.digests[file_path] = ((stat.st_mtime_ns, stat.st_size), hashlib.sha256(data).digest())
+        self.written += 1
+        return True
+
+    def keep(self, file_path : str):
+        """Record an existing output file which did not need to be generated again"""
+        if self.keep_paths:
+            self.file_paths.append(file_path)
+        self.skipped += 1
+
+    def log_summary(self):
+        logger.info(f"Wrote {self.written} output file(s), skipped {self.skipped} unchanged")
+
+    def write_archive(self, archive_path : str):
+        """Pack every output file of the run into one zip or tar archive, written atomically.
+
+        :param archive_path: Path of the archive; its suffix (.zip, .tar, .tar.gz, .tgz, .tar.xz) sets the format."""
+        mode = next((mode for suffix, mode in ARCHIVE_MODES.items() if archive_path.endswith(suffix)), None)
+        if mode is None:
+            raise ValueError(f"Invalid archive {archive_path!r}, expected one of the suffixes: {', '.join(ARCHIVE_MODES)}")
+
+        directory = os.path.dirname(archive_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        fd, tmp_path = create_temp_file(archive_path)
+        os.close(fd)
+        try:
+            file_paths = list(dict.fromkeys(self.file_paths))
+            if mode == "zip":
+                with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                    for file_path in file_paths:
+                        zf.write(file_path, os.path.relpath(file_path))
+            else:
+                with tarfile.open(tmp_path, mode) as tf:
+                    for file_path in file_paths:
+                        tf.add(file_path, os.path.relpath(file_path))
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.info(f"Archived {len(file_paths)} output file(s) into {archive_path}")
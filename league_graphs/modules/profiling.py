@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from .main import get_config_bool
+from collections import defaultdict
+from collections.abc import Generator
+from contextlib import contextmanager
+from time import perf_counter
+import cProfile
+import io
+import logging
+import os
+import pstats
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+
+class RunProfiler(object):
+    """Collects per-stage and per-subject timings of a graph generation run,
+    with optional cProfile and tracemalloc capture"""
+    def __init__(self, config : dict | None = None):
+        """Configure the profiler from the [profiling] section of league_graphs.conf.
+
+        :param config: Section with keys enabled, cprofile, cprofile_output, tracemalloc and summary_size."""
+        config = config or {}
+        self.enabled = get_config_bool(config, "enabled", True)
+        self.use_cprofile = get_config_bool(config, "cprofile", False)
+        self.cprofile_output = config.get("cprofile_output", "")
+        self.use_tracemalloc = get_config_bool(config, "tracemalloc", False)
+        self.summary_size = int(config.get("summary_size", 10))
+
+        self.stage_totals = defaultdict(float)
+        self.stage_counts = defaultdict(int)
+        self.subject_totals = {"club": defaultdict(float), "derby": defaultdict(float)}
+        self.subject_stages = {"club": defaultdict(dict), "derby": defaultdict(dict)}
+        self._current_subject = None
+        self._profile = None
+        self._run_start = None
+
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    #                                   RUN CONTROL                                   #
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    def start(self):
+        """Start the run clock and, if configured, cProfile and tracemalloc capture"""
+        self._run_start = perf_counter()
+        if self.use_cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if self.use_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        """Stop any running capture and log its results"""
+        if self._profile:
+            self._profile.disable()
+            self._log_cprofile()
+            self._profile = None
+        if self.use_tracemalloc and tracemalloc.is_tracing():
+            self._log_tracemalloc()
+            tracemalloc.stop()
+
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    #                                     TIMERS                                      #
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    @contextmanager
+    def stage(self, name : str) -> Generator[None]:
+        """Time a pipeline stage, aggregating it for the run and for the subject being generated.
+
+        :param name: Stage name (ingestion, background, plot_lines, serialization, rasterization, writing)."""
+        if not self.enabled:
+            yield
+            return
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = perf_counter() - start
+            self.stage_totals[name] += elapsed
+            self.stage_counts[name] += 1
+            if self._current_subject:
+                kind, subject = self._current_subject
+                stages = self.subject_stages[kind][subject]
+                stages[name] = stages.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def subject(self, kind : str, name : str) -> Generator[None]:
+        """Time the whole generation of one graph, attributing nested stages to it.
+
+        :param kind: Either "club" or "derby".
+        :param name: Full name of the club or derby."""
+        if not self.enabled:
+            yield
+            return
+
+        previous = self._current_subject
+        self._current_subject = (kind, name)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.subject_totals[kind][name] += perf_counter() - start
+            self._current_subject = previous
+
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    #                                     REPORTS                                     #
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    def log_summary(self):
+        """Log the per-stage totals and the slowest clubs and derbies of this run"""
+        if not self.enabled:
+            return
+
+        total = perf_counter() - self._run_start if self._run_start else sum(self.stage_totals.values())
+        lines = [f"Run summary ({total:.3f}s total)", f"{'stage':<16}{'calls':>8}{'total (s)':>12}{'mean (ms)':>12}"]
+        for name, elapsed in sorted(self.stage_totals.items(), key=lambda item: item[1], reverse=True):
+            calls = self.stage_counts[name]
+            lines.append(f"{name:<16}{calls:>8}{elapsed:>12.3f}{elapsed / calls * 1000:>12.2f}")
+
+        for kind in ("club", "derby"):
+            slowest = sorted(self.subject_totals[kind].items(), key=lambda item: item[1], reverse=True)
+            if not slowest:
+                continue
+            lines.append(f"Slowest {kind} graphs:")
+            for name, elapsed in slowest[:self.summary_size]:
+                stages = self.subject_stages[kind][name]
+                stages_str = ", ".join(f"{stage} {value * 1000:.1f}ms" for stage, value in stages.items())
+                lines.append(f"  {elapsed * 1000:>9.1f}ms  {name} ({stages_str})")
+
+        logger.info("\n".join(lines))
+
+    def _log_cprofile(self):
+        """Log the top cumulative entries of the cProfile capture and dump it if an output path is set"""
+        if self.cprofile_output:
+            self._profile.dump_stats(self.cprofile_output)
+            logger.info(f"Wrote cProfile statistics to {self.cprofile_output}")
+        stream = io.StringIO()
+        pstats.Stats(self._profile, stream=stream).sort_stats("cumulative").print_stats(self.summary_size)
+        logger.info(f"cProfile top {self.summary_size} by cumulative time:\n{stream.getvalue()}")
+
+    def _log_tracemalloc(self):
+        """Log peak traced memory and the top allocation sites"""
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        top_stats = snapshot.statistics("lineno")[:self.summary_size]
+        top_str = "\n".join(f"  {stat}" for stat in top_stats)
+        logger.info(f"tracemalloc: current {current / 2**20:.1f}MiB, peak {peak / 2**20:.1f}MiB\n{top_str}")
+
+
+def get_memory_usage() -> float:
+    """Current resident set size of the process in MiB (peak resident size where /proc is not available)"""
+    try:
+        with open("/proc/self/statm") as fp:
+            resident_pages = int(fp.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+        import sys
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS, in KiB elsewhere
+        return max_rss / 2**20 if sys.platform == "darwin" else max_rss / 2**10
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from .main import get_config_bool
+from collections import defaultdict
+from time import perf_counter
+from typing import Any
+import logging
+import psycopg2
+import psycopg2.extensions
+import re
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in milliseconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+_RE_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_RE_SPACE = re.compile(r"\s+")
+
+
+class QueryStats(object):
+    """Aggregates query counts, latency histograms and row counts per statement shape"""
+    def __init__(self, config : dict | None = None):
+        """Configure query instrumentation from the [query_stats] section of league_graphs.conf.
+
+        :param config: Section with keys enabled, slow_query_ms and summary_size."""
+        config = config or {}
+        self.enabled = get_config_bool(config, "enabled", True)
+        self.slow_query_ms = float(config.get("slow_query_ms", 200))
+        self.summary_size = int(config.get("summary_size", 10))
+        self.shapes = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)})
+
+    def record(self, query : str, elapsed_ms : float, rows : int):
+        """Add one executed statement to the statistics, logging it if it is above the slow query threshold.
+
+        :param query: SQL statement as sent to the database.
+        :param elapsed_ms: Execution time in milliseconds.
+        :param rows: Number of rows returned or affected (-1 if unknown)."""
+        shape = self.get_shape(query)
+        stats = self.shapes[shape]
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["rows"] += max(rows, 0)
+        stats["histogram"][self._get_bucket(elapsed_ms)] += 1
+
+        # Only the shape is logged: literal values may be credentials (e.g. the database initialization call)
+        if elapsed_ms >= self.slow_query_ms:
+            logger.warning(f"Slow query ({elapsed_ms:.1f}ms, {rows} rows): {shape[:500]}")
+
+    def get_shape(self, query : str) -> str:
+        """Normalize a statement into its shape: literals replaced by ? and IN lists collapsed"""
+        shape = _RE_STRING.sub("?", query)
+        shape = _RE_NUMBER.sub("?", shape)
+        shape = _RE_LIST.sub("(...)", shape)
+        return _RE_SPACE.sub(" ", shape).strip()
+
+    def log_summary(self):
+        """Log the statement shapes with the highest total latency"""
+        if not self.shapes:
+            return
+        bucket_labels = [f"<{bound}" for bound in LATENCY_BUCKETS_MS] + [f">={LATENCY_BUCKETS_MS[-1]}"]
+        lines = [f"Query summary ({sum(s['count'] for s in self.shapes.values())} statements, {len(self.shapes)} shapes)"]
+        slowest = sorted(self.shapes.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+        for shape, stats in slowest[:self.summary_size]:
+            histogram = " ".join(f"{label}:{n}" for label, n in zip(bucket_labels, stats["histogram"]) if n)
+            lines.append(
+                f"  {stats['count']:>6}x {stats['total_ms']:>9.1f}ms total, {stats['total_ms'] / stats['count']:>7.2f}ms mean, "
+                f"{stats['max_ms']:>7.1f}ms max, {stats['rows']} rows [{histogram} ms] {shape[:200]}"
+            )
+        logger.info("\n".join(lines))
+
+    def _get_bucket(self, elapsed_ms : float) -> int:
+        """Get the index of the histogram bucket for a latency"""
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms < bound:
+                return i
+        return len(LATENCY_BUCKETS_MS)
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor recording each statement's latency and row count into a QueryStats instance"""
+    stats: QueryStats | None = None
+
+    def execute(self, query : Any, vars : Any = None):
+        """Execute a statement, timing it if a QueryStats instance is attached to this cursor"""
+        stats = self.stats
+        if not stats or not stats.enabled:
+            return super().execute(query, vars)
+
+        start = perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed_ms = (perf_counter() - start) * 1000
+            query_str = self.query.decode("utf-8", "replace") if self.query else str(query)
+            stats.record(query_str, elapsed_ms, self.rowcount)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+from lxml import etree
+from typing import TYPE_CHECKING
+import importlib
+import importlib.util
+import io
+import logging
+import shutil
+import subprocess
+
+if TYPE_CHECKING:
+    import PIL.Image
+
+logger = logging.getLogger(__name__)
+
+# svglib converts SVG px into PDF points (3/4), so the reference PNGs are 0.75 times the SVG size
+RASTER_SCALE = 0.75
+
+
+class Rasterizer(object):
+    """Base class of the SVG -> PNG backends. Backends receive the in-memory tree and/or its serialized
+    bytes, so the SVG is never re-read from disk in order to be rasterized"""
+    name: str
+
+    @classmethod
+    def is_available(cls) -> bool:
+        """Whether the backend's dependencies are installed"""
+        raise NotImplementedError("Method is_available is not implemented on the base class Rasterizer")
+
+    def render(self, png_path : str, root : etree._Element | None = None, data : bytes | None = None):
+        """Rasterize an SVG document into a PNG file.
+
+        :param png_path: Path of the PNG file to be written.
+        :param root: svg element of the document, if available.
+        :param data: Serialized SVG document, if available (at least one of root/data must be given)."""
+        raise NotImplementedError("Method render is not implemented on the base class Rasterizer")
+
+    def render_image(self, root : etree._Element | None = None, data : bytes | None = None) -> "PIL.Image.Image":
+        """Rasterize an SVG document into an in-memory PIL image (RGB, or RGBA for backends that keep transparency)"""
+        raise NotImplementedError(f"Method render_image is not implemented on the {self.name} rasterizer")
+
+    def render_png(self, root : etree._Element | None = None, data : bytes | None = None) -> bytes:
+        """Rasterize an SVG document into in-memory PNG bytes (same output as render, without a file)"""
+        buffer = io.BytesIO()
+        self.render_image(root=root, data=data).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def render_layer(self, root : etree._Element, background : "PIL.Image.Image") -> "PIL.Image.Image":
+        """Rasterize an SVG document without a background fill on top of an already rasterized background.
+
+        :param root: svg element holding only the layer's elements.
+        :param background: RGB image of the shared background, which is not modified.
+        :return: New RGB image with the layer drawn over the background."""
+        from PIL import Image
+        layer = self.render_image(root=root).convert("RGBA")
+        return Image.alpha_composite(background.convert("RGBA"), layer).convert("RGB")
+
+    def _get_data(self, root : etree._Element | None, data : bytes | None) -> bytes:
+        """Get the serialized document, serializing the tree only if needed"""
+        if data is None:
+            data = etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=False)
+        return data
+
+
+class ReportlabRasterizer(Rasterizer):
+    """Reference backend: svglib + reportlab renderPM, rendering straight from the lxml tree"""
+    name = "reportlab"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return bool(importlib.util.find_spec("svglib") and importlib.util.find_spec("reportlab"))
+
+    def render(self, png_path : str, root : etree._Element | None = None, data : bytes | None = None):
+        from reportlab.graphics import renderPM
+        from svglib.svglib import SvgRenderer, load_svg_file
+        if root is None:
+            root = load_svg_file(io.BytesIO(data))
+        drawing = SvgRenderer("").render(root)
+        renderPM.drawToFile(drawing, png_path, fmt="PNG")
+
+    def render_image(self, root : etree._Element | None = None, data : bytes | None = None) -> "PIL.Image.Image":
+        from reportlab.graphics import renderPM
+        from svglib.svglib import SvgRenderer, load_svg_file
+        if root is None:
+            root = load_svg_file(io.BytesIO(data))
+        return renderPM.drawToPMCanvas(SvgRenderer("").render(root)).toPIL()
+
+    def render_png(self, root : etree._Element | None = None, data : bytes | None = None) -> bytes:
+        from reportlab.graphics import renderPM
+        from svglib.svglib import SvgRenderer, load_svg_file
+        if root is None:
+            root = load_svg_file(io.BytesIO(data))
+        return renderPM.drawToString(SvgRenderer("").render(root), fmt="PNG")
+
+    def render_layer(self, root : etree._Element, background : "PIL.Image.Image") -> "PIL.Image.Image":
+        """renderPM has no transparency, so the layer is rendered over black and over white: their difference
+        is each pixel's transparency, and the layer is composited as over_black + background * (over_white - over_black)"""
+        from PIL import ImageChops
+        from reportlab.graphics import renderPM
+        from svglib.svglib import SvgRenderer
+        drawing = SvgRenderer("").render(root)
+        over_white = renderPM.drawToPIL(drawing, bg=0xFFFFFF).convert("RGB")
+        over_black = renderPM.drawToPIL(drawing, bg=0x000000).convert("RGB")
+        return ImageChops.add(over_black, ImageChops.multiply(background, ImageChops.subtract(over_white, over_black)))
+
+
+class CairoSvgRasterizer(Rasterizer):
+    """Backend using the cairosvg package"""
+    name = "cairosvg"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        # cairosvg installs without the cairo shared library, which is only loaded on import
+        if not importlib.util.find_spec("cairosvg"):
+            return False
+        try:
+            importlib.import_module("cairosvg")
+        except OSError:
+            return False
+        return True
+
+    def render(self, png_path : str, root : etree._Element | None = None, data : bytes | None = None):
+        import cairosvg
+        cairosvg.svg2png(bytestring=self._get_data(root, data), write_to=png_path, scale=RASTER_SCALE)
+
+    def render_image(self, root : etree._Element | None = None, data : bytes | None = None) -> "PIL.Image.Image":
+        import cairosvg
+        from PIL import Image
+        png = cairosvg.svg2png(bytestring=self._get_data(root, data), scale=RASTER_SCALE)
+        return Image.open(io.BytesIO(png))
+
+    def render_png(self, root : etree._Element | None = None, data : bytes | None = None) -> bytes:
+        import cairosvg
+        return cairosvg.svg2png(bytestring=self._get_data(root, data), scale=RASTER_SCALE)
+
+
+class RsvgRasterizer(Rasterizer):
+    """Backend piping the document through librsvg's rsvg-convert executable"""
+    name = "rsvg"
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return bool(shutil.which("rsvg-convert"))
+
+    def render(self, png_path : str, root : etree._Element | None = None, data : bytes | None = None):
+        subprocess.run(
+            ["rsvg-convert", "--format", "png", "--zoom", str(RASTER_SCALE), "--output", png_path],
+            input=self._get_data(root, data), check=True,
+        )
+
+    def render_image(self, root : etree._Element | None = None, data : bytes | None = None) -> "PIL.Image.Image":
+        from PIL import Image
+        return Image.open(io.BytesIO(self.render_png(root=root, data=data)))
+
+    def render_png(self, root : etree._Element | None = None, data : bytes | None = None) -> bytes:
+        result = subprocess.run(
+            ["rsvg-convert", "--format", "png", "--zoom", str(RASTER_SCALE)],
+            input=self._get_data(root, data), capture_output=True, check=True,
+        )
+        return result.stdout
+
+
+# Backends by name; "auto" picks the first available one in this order
+RASTERIZERS = {
+    "cairosvg": CairoSvgRasterizer,
+    "rsvg": RsvgRasterizer,
+    "reportlab": ReportlabRasterizer,
+}
+
+
+def get_rasterizer(name : str = "reportlab") -> Rasterizer:
+    """Instantiate a rasterizer backend by name, or the first available one for "auto".
+
+    :param name: One of the RASTERIZERS keys, or "auto".
+    :return: Rasterizer instance."""
+    if name == "auto":
+        for rasterizer_class in RASTERIZERS.values():
+            if rasterizer_class.is_available():
+                logger.info(f"Using {rasterizer_class.name} rasterizer")
+                return rasterizer_class()
+        raise RuntimeError("No rasterizer backend is available")
+
+    if name not in RASTERIZERS:
+        raise ValueError(f"Invalid rasterizer {name!r}, expected one of: auto, {', '.join(RASTERIZERS)}")
+    rasterizer_class = RASTERIZERS[name]
+    if not rasterizer_class.is_available():
+        raise RuntimeError(f"Rasterizer {name!r} is not available")
+    return rasterizer_class()
+
+
+def get_image_difference(png_path_a : str, png_path_b : str) -> float:
+    """Compare two PNG files pixel by pixel, used to check backends against the reportlab output.
+
+    :return: Mean absolute difference per channel (0-255), or infinity if the sizes differ."""
+    from PIL import Image, ImageChops, ImageStat
+    with Image.open(png_path_a) as image_a, Image.open(png_path_b) as image_b:
+        image_a, image_b = image_a.convert("RGB"), image_b.convert("RGB")
+        if image_a.size != image_b.size:
+            return float("inf")
+        return max(ImageStat.Stat(ImageChops.difference(image_a, image_b)).mean)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+from .graph_generator import GraphGenerator
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {"svg": "image/svg+xml", "png": "image/png"}
+
+
+class ResponseCache(object):
+    """Thread-safe LRU cache of rendered responses (bytes and ETag), keyed by request path"""
+    def __init__(self, size : int = 256):
+        """:param size: Maximum number of cached responses (0 disables the cache)."""
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key : str) -> tuple[bytes, str] | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key : str, data : bytes) -> tuple[bytes, str]:
+        """Store a response, evicting the least recently used ones beyond the cache size"""
+        entry = (data, f'"{hashlib.sha1(data).hexdigest()}"')
+        if self.size:
+            with self.lock:
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return entry
+
+
+class RenderServer(ThreadingHTTPServer):
+    """Local HTTP service rendering graphs on demand from a warm GraphGenerator:
+    - /club/<short_name>.svg|png: a club's graph;
+    - /derby/<short_name>/<short_name>[/...].svg|png: the graph of any clubs together, titled as in the
+      derby catalogue when they form one of its derbies."""
+    daemon_threads = True
+
+    def __init__(self, generator : GraphGenerator, address : tuple[str, int], cache_size : int = 256, png_workers : int = 2):
+        """:param generator: Generator holding the ingested data.
+        :param address: Host and port to listen on.
+        :param cache_size: Maximum number of rendered responses kept in memory.
+        :param png_workers: Number of threads rasterizing PNG responses."""
+        super().__init__(address, RenderRequestHandler)
+        self.generator = generator
+        self.clubs = {club_info["short_name"]: club_info for club_info in generator.club_info.values()}
+        self.derbies = {frozenset(derby["clubs"]): derby for derby in generator.derbies}
+        self.cache = ResponseCache(cache_size)
+        self.png_executor = ThreadPoolExecutor(max_workers=png_workers, thread_name_prefix="png")
+        # Building documents goes through the generator's shared state (profiler, fragment cache)
+        self.generator_lock = threading.Lock()
+
+    def server_close(self):
+        super().server_close()
+        self.png_executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_response(self, path : str) -> tuple[bytes, str, str] | None:
+        """Render (or get from the cache) the response of a request path.
+
+        :param path: Unquoted request path, without query string.
+        :return: Response bytes, ETag and content type, or None if the path matches no graph."""
+        kind, _, name = path.strip("/").partition("/")
+        name, _, extension = name.rpartition(".")
+        if extension not in CONTENT_TYPES or kind not in ("club", "derby"):
+            return None
+        entry = self.cache.get(path)
+        if entry is not None:
+            return *entry, CONTENT_TYPES[extension]
+
+        # PNG responses are rasterized from the (cached) SVG response
+        if extension == "png":
+            svg_response = self.get_response(f"{path[:-len('.png')]}.svg")
+            if svg_response is None:
+                return None
+            data = self.png_executor.submit(self.generator.rasterizer.render_png, data=svg_response[0]).result()
+            return *self.cache.set(path, data), CONTENT_TYPES[extension]
+
+        short_names = name.split("/")
+        if kind == "club" and len(short_names) != 1 or kind == "derby" and len(short_names) < 2:
+            return None
+        if any(short_name not in self.clubs for short_name in short_names):
+            return None
+
+        generator = self.generator
+        full_names = tuple(self.clubs[short_name]["full_name"] for short_name in short_names)
+        with self.generator_lock:
+            if kind == "club":
+                root = generator.get_club_tree(self.clubs[short_names[0]])
+            else:
+                derby = self.derbies.get(frozenset(full_names))
+                derby = {"full_name": derby["full_name"] if derby else "", "clubs": full_names}
+                root = generator.get_derby_tree(derby, generator.club_info)
+            data = generator.get_svg_data(root)
+        return *self.cache.set(path, data), CONTENT_TYPES[extension]
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    server: RenderServer
+
+    def do_GET(self):
+        path = unquote(urlsplit(self.path).path)
+        try:
+            response = self.server.get_response(path)
+        except Exception:
+            logger.exception(f"Could not render {path}")
+            self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR)
+            return
+        if response is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        data, etag, content_type = response
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format : str, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+def serve(generator : GraphGenerator, config : dict | None = None):
+    """Serve the generator's graphs until interrupted.
+
+    :param generator: Generator holding the ingested data.
+    :param config: [server] section of league_graphs.conf, with keys host, port, cache_size and png_workers."""
+    config = config or {}
+    address = (config.get("host", "127.0.0.1"), int(config.get("port", 8000)))
+    server = RenderServer(generator, address, int(config.get("cache_size", 256)), int(config.get("png_workers", 2)))
+    logger.info(f"Serving graphs on http://{address[0]}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopped serving")
+    finally:
+        server.server_close()
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+from .main import ROOT_DIR
+from .logging_queue import init_worker_logging
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
+from typing import TYPE_CHECKING
+import io
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+
+if TYPE_CHECKING:
+    import PIL.Image
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = "snapshots"
+SVG_MODES = ("standard", "compact")
+# PNG snapshots are thumbnails compared with a tolerance: renderPM's anti-aliasing is not bit-for-bit
+# reproducible (the same document rendered twice in one process differs on a few hundred pixels)
+THUMBNAIL_SCALE = 4
+
+
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+#                               SYNTHETIC WORKBOOKS                               #
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+def get_basic_scenario() -> dict:
+    """Small hand-written pyramid: 3 tiers expanding halfway, and one club per drawing case
+    (continuous solid line, border line with gaps and an isolated season, dashed line with administrative
+    jumps, default line type with theme/transparent colors, dashed line with a jump after a gap)"""
+    seasons = [f"{1938 + i}-{(39 + i) % 100:02d}" for i in range(16)]
+    league_sizes = [[8, 18, 32] if i < 8 else [10, 22, 36] for i in range(16)]
+    _ = None
+    clubs = [
+        ("Solid Club", "solid", ("FF0000", "FFFFFF"), [
+            (1, 3), (1, 1), (1, 5), (2, 2), (2, 1), (1, 8), (1, 4), (1, 2),
+            (1, 1), (2, 6), (3, 9), (3, 2), (2, 12), (2, 1), (1, 10), (1, 3),
+        ]),
+        ("Border Club", "border", ("006600", "FFCC00"), [
+            _, _, (2, 4), (2, 7), (2, 10), _, (3, 5), _,
+            (2, 3), (2, 2), (1, 9), (1, 7), (1, 6), _, _, _,
+        ]),
+        ("Dashed Club", "dashed", ("0000CC", "FFFFFF"), [
+            (3, 1), (3, 2), (1, 7), (1, 8), (1, 6), (3, 4), (3, 1), (2, 5),
+            (2, 1), _, (2, 9), (3, 14), (1, 5), (1, 2), (1, 1), (1, 4),
+        ]),
+        ("Default Club", None, ("theme:0", "00123456"), [
+            (3, 12), (3, 11), (3, 13), (3, 8), (3, 7), (2, 10), (2, 9), (3, 1),
+            (3, 3), (3, 5), (3, 6), (2, 11), (2, 12), (3, 2), (3, 4), (3, 6),
+        ]),
+        ("Dashed Gaps", "dashed", ("theme:1", "CC0000"), [
+            (2, 6), (2, 8), _, (3, 3), (1, 9), (1, 10), _, _,
+            (3, 7), (3, 2), (2, 4), _, (2, 8), (2, 3), (1, 12), (1, 9),
+        ]),
+    ]
+    derbies = {
+        "derbies": [
+            {"full_name": "Synthetic Derby", "clubs": ["Solid Club", "Dashed Club"]},
+            {"full_name": "Three Way", "clubs": ["Solid Club", "Border Club", "Dashed Club"]},
+        ],
+        "regions": [{"name": "Region", "clubs": ["Default Club", "Dashed Gaps", "Border Club"]}],
+    }
+    return {"seasons": seasons, "league_sizes": league_sizes, "clubs": clubs, "derbies": derbies}
+
+
+def get_long_scenario(seed : int = 20) -> dict:
+    """Seeded random 4-tier pyramid over 45 seasons, with random gaps and administrative jumps.
+    The last two seasons are always played without a jump, as the drawing code looks one season ahead."""
+    rng = random.Random(seed)
+    no_seasons = 45
+    seasons = [f"{1938 + i}-{(39 + i) % 100:02d}" for i in range(no_seasons)]
+    league_sizes = []
+    sizes = [8, 10, 12, 14]
+    for i in range(no_seasons):
+        if i and i % 9 == 0:
+            sizes = [size + rng.choice((0, 2)) for size in sizes]
+        league_sizes.append([sum(sizes[:tier + 1]) for tier in range(4)])
+
+    clubs = []
+    line_types = ("solid", "border", "dashed")
+    for club_no in range(10):
+        league, history = rng.randint(1, 4), []
+        for i in range(no_seasons):
+            last_seasons = i >= no_seasons - 2
+            if not last_seasons and rng.random() < 0.08:
+                history.append(None)
+                continue
+            if not last_seasons and rng.random() < 0.06:
+                league = 1 if league >= 3 else league + 2
+            elif rng.random() < 0.3:
+                league = min(4, max(1, league + rng.choice((-1, 1))))
+            tier_size = league_sizes[i][league - 1] - (league_sizes[i][league - 2] if league > 1 else 0)
+            history.append((league, rng.randint(1, tier_size)))
+        colors = (f"{rng.randint(0, 0xFFFFFF):06X}", f"{rng.randint(0, 0xFFFFFF):06X}")
+        clubs.append((f"Random Club {club_no}", line_types[club_no % 3], colors, history))
+
+    derbies = {
+        "derbies": [{"full_name": "Random Derby", "clubs": ["Random Club 0", "Random Club 1"]}],
+        "regions": [{"name": "Random Region", "clubs": ["Random Club 2", "Random Club 3", "Random Club 4"]}],
+    }
+    return {"seasons": seasons, "league_sizes": league_sizes, "clubs": clubs, "derbies": derbies}
+
+
+SCENARIOS = {
+    "basic": get_basic_scenario,
+    "long": get_long_scenario,
+}
+
+
+def write_scenario_workbook(scenario : dict, file_path : str):
+    """Write a scenario as a workbook with the same layout as Graphs_SVG_Portugal.xlsx"""
+    import openpyxl
+    from openpyxl.styles import PatternFill
+    from openpyxl.styles.colors import Color
+
+    wb = openpyxl.Workbook()
+    ws_league_sizes = wb.active
+    ws_league_sizes.title = "League Sizes"
+    pyramid_size = len(scenario["league_sizes"][0])
+    ws_league_sizes.append([None, None] + [value for tier in range(1, pyramid_size + 1) for value in (tier, None)])
+    for season, sizes in zip(scenario["seasons"], scenario["league_sizes"]):
+        ws_league_sizes.append([season, None] + [value for size in sizes for value in (size, None)])
+
+    ws_clubs = wb.create_sheet("Clubs")
+    ws_clubs.append([None] + [value for name, *_ in scenario["clubs"] for value in (name, None, None)])
+    ws_clubs.append([None] + [value for _, line_type, *_ in scenario["clubs"] for value in (line_type, None, None)])
+    for club_no, (_, _, colors, _) in enumerate(scenario["clubs"]):
+        for row, color in zip((1, 2), colors):
+            if color.startswith("theme:"):
+                fg_color = Color(theme=int(color[len("theme:"):]))
+            else:
+                fg_color = Color(rgb=color if len(color) == 8 else f"FF{color}")
+            ws_clubs.cell(row, 2 + club_no * 3).fill = PatternFill("solid", fgColor=fg_color)
+
+    for i, season in enumerate(scenario["seasons"]):
+        row = [season]
+        for _, _, _, history in scenario["clubs"]:
+            if history[i] is None:
+                row += [None, None, None]
+                continue
+            league, position = history[i]
+            row += [league, position, (scenario["league_sizes"][i][league - 2] if league > 1 else 0) + position]
+        ws_clubs.append(row)
+    wb.save(file_path)
+
+
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+#                                    RENDERING                                    #
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+def canonicalize_svg(data : bytes) -> str:
+    """Canonical XML (C14N 2.0: attribute order, quoting, no comments nor whitespace-only text) of a
+    generated document, with one element per line so that snapshot differences read as line diffs"""
+    canonical = etree.canonicalize(etree.fromstring(data), strip_text=True)
+    return re.sub(r">\s*<", ">\n<", canonical) + "\n"
+
+
+def get_thumbnail(png_data : bytes) -> "PIL.Image.Image":
+    """Downscaled RGB copy of a rendered PNG, as kept in the PNG snapshots"""
+    from PIL import Image
+    image = Image.open(io.BytesIO(png_data)).convert("RGB")
+    size = (max(1, image.size[0] // THUMBNAIL_SCALE), max(1, image.size[1] // THUMBNAIL_SCALE))
+    return image.resize(size, Image.BOX)
+
+
+def render_snapshots(scenario_dir : str, svg_mode : str, chunk : int, chunks : int, png : bool) -> dict[str, tuple[str, bytes | None]]:
+    """Render one share of a scenario's graphs in memory (dispatched to worker processes).
+
+    :param scenario_dir: Directory holding the scenario's workbook.xlsx and derbies.json.
+    :param svg_mode: Generator SVG output mode (standard or compact).
+    :param chunk: Index of the share of graphs to render.
+    :param chunks: Number of shares the graphs are split into.
+    :param png: Whether to also rasterize each graph into a thumbnail.
+    :return: Canonical SVG and thumbnail PNG bytes (or None) by snapshot path (kind/short_name)."""
+    from .graph_generator import GraphGenerator
+
+    config = {
+        "pipeline": {"workbook": os.path.join(scenario_dir, "workbook.xlsx")},
+        "derbies": {"catalogue": os.path.join(scenario_dir, "derbies.json")},
+        "output": {"svg_mode": svg_mode, "rasterizer": "reportlab"},
+        "profiling": {"enabled": "false"},
+    }
+    cwd = os.getcwd()
+    # The generator creates its output directories in the working directory
+    os.chdir(scenario_dir)
+    try:
+        generator = GraphGenerator(config, streaming=False)
+        graphs = [(f"clubs/{club_info['short_name']}", generator.get_club_tree, (club_info,)) for club_info in generator.club_info.values()]
+        graphs += [(f"derbies/{derby['short_name']}", generator.get_derby_tree, (derby, generator.club_info)) for derby in generator.derbies]
+        graphs.append(("comparisons/All_Clubs", generator.get_comparison_tree, ("All Clubs", list(generator.club_info.values()))))
+
+        output = {}
+        for snapshot_path, get_tree, args in graphs[chunk::chunks]:
+            root = get_tree(*args)
+            data = generator.get_svg_data(root)
+            thumbnail = None
+            if png:
+                buffer = io.BytesIO()
+                get_thumbnail(generator.rasterizer.render_png(root=root, data=data)).save(buffer, format="PNG")
+                thumbnail = buffer.getvalue()
+            output[snapshot_path] = (canonicalize_svg(data), thumbnail)
+        return output
+    finally:
+        os.chdir(cwd)
+
+
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+#                                     HARNESS                                     #
+# = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+class SnapshotHarness(object):
+    """Golden-file regression check of the generated graphs: synthetic workbooks are rendered in every
+    SVG mode (in parallel worker processes) and compared with the snapshots kept in league_graphs/snapshots"""
+    def __init__(self, jobs : int = 0, png : bool = False, tolerance : float = 1.0, scenarios : list[str] | None = None):
+        """:param jobs: Number of worker processes; the number of CPUs if zero.
+        :param png: Whether to also compare PNG thumbnails.
+        :param tolerance: Maximum mean channel difference (0-255) between PNG thumbnails.
+        :param scenarios: Names of the SCENARIOS to run; all of them if not set."""
+        self.jobs = jobs or os.cpu_count() or 1
+        self.png = png
+        self.tolerance = tolerance
+        self.scenarios = scenarios or list(SCENARIOS)
+        self.snapshot_dir = os.path.join(ROOT_DIR, SNAPSHOT_DIR)
+
+    def render(self) -> dict[str, tuple[str, bytes | None]]:
+        """Render every scenario in every SVG mode.
+
+        :return: Canonical SVG and thumbnail by snapshot path (scenario/svg_mode/kind/short_name)."""
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tasks = []
+            for name in self.scenarios:
+                scenario = SCENARIOS[name]()
+                scenario_dir = os.path.join(tmp_dir, name)
+                os.makedirs(scenario_dir)
+                write_scenario_workbook(scenario, os.path.join(scenario_dir, "workbook.xlsx"))
+                with open(os.path.join(scenario_dir, "derbies.json"), "w", encoding="utf-8") as fp:
+                    json.dump(scenario["derbies"], fp)
+                tasks += [(name, scenario_dir, svg_mode, chunk) for svg_mode in SVG_MODES for chunk in range(self.jobs)]
+
+            logger.info(f"Rendering {len(self.scenarios)} snapshot scenario(s) with {self.jobs} job(s)")
+            if self.jobs > 1:
+                with ProcessPoolExecutor(max_workers=self.jobs, initializer=init_worker_logging) as executor:
+                    futures = [
+                        (name, svg_mode, executor.submit(render_snapshots, scenario_dir, svg_mode, chunk, self.jobs, self.png))
+                        for name, scenario_dir, svg_mode, chunk in tasks
+                    ]
+                    outputs = [(name, svg_mode, future.result()) for name, svg_mode, future in futures]
+            else:
+                outputs = [
+                    (name, svg_mode, render_snapshots(scenario_dir, svg_mode, chunk, self.jobs, self.png))
+                    for name, scenario_dir, svg_mode, chunk in tasks
+                ]
+
+        for name, svg_mode, output in outputs:
+            for snapshot_path, result in output.items():
+                results[f"{name}/{svg_mode}/{snapshot_path}"] = result
+        return results
+
+    def check(self, results : dict[str, tuple[str, bytes | None]]) -> list[str]:
+        """Compare rendered graphs with the stored snapshots.
+
+        :return: One message per failed snapshot (an empty list if everything matches)."""
+        from .rasterizers import get_image_difference
+
+        failures = []
+        for snapshot_path, (svg, thumbnail) in sorted(results.items()):
+            svg_path = os.path.join(self.snapshot_dir, f"{snapshot_path}.svg")
+            if not os.path.exists(svg_path):
+                failures.append(f"{snapshot_path}: no snapshot (run with --update to create it)")
+                continue
+            with open(svg_path, encoding="utf-8") as fp:
+                expected = fp.read()
+            if svg != expected:
+                failures.append(f"{snapshot_path}: SVG differs\n{self._get_first_difference(expected, svg)}")
+
+            if thumbnail is not None:
+                png_path = os.path.join(self.snapshot_dir, f"{snapshot_path}.png")
+                if not os.path.exists(png_path):
+                    failures.append(f"{snapshot_path}: no PNG snapshot (run with --png --update to create it)")
+                    continue
+                difference = get_image_difference(png_path, io.BytesIO(thumbnail))
+                if difference > self.tolerance:
+                    failures.append(f"{snapshot_path}: PNG mean difference {difference:.3f} above tolerance {self.tolerance}")
+
+        rendered = {f"{snapshot_path}.svg" for snapshot_path in results}
+        for svg_path in self._get_stored_snapshots():
+            if svg_path not in rendered:
+                failures.append(f"{svg_path[:-len('.svg')]}: snapshot of a graph which is no longer generated")
+        return failures
+
+    def update(self, results : dict[str, tuple[str, bytes | None]]):
+        """Replace the stored snapshots of the rendered scenarios with the rendered graphs"""
+        rendered = set()
+        for snapshot_path, (svg, thumbnail) in results.items():
+            svg_path = os.path.join(self.snapshot_dir, f"{snapshot_path}.svg")
+            os.makedirs(os.path.dirname(svg_path), exist_ok=True)
+            with open(svg_path, "w", encoding="utf-8") as fp:
+                fp.write(svg)
+            rendered.add(f"{snapshot_path}.svg")
+            if thumbnail is not None:
+                with open(os.path.join(self.snapshot_dir, f"{snapshot_path}.png"), "wb") as fp:
+                    fp.write(thumbnail)
+
+        for svg_path in self._get_stored_snapshots():
+            if svg_path not in rendered:
+                for extension in (".svg", ".png"):
+                    stale_path = os.path.join(self.snapshot_dir, f"{svg_path[:-len('.svg')]}{extension}")
+                    if os.path.exists(stale_path):
+                        os.remove(stale_path)
+        logger.info(f"Updated {len(results)} snapshot(s) in {self.snapshot_dir}")
+
+    def _get_stored_snapshots(self) -> list[str]:
+        """Stored SVG snapshots of the harness' scenarios, relative to the snapshot directory"""
+        output = []
+        for name in self.scenarios:
+            for directory, _, file_names in os.walk(os.path.join(self.snapshot_dir, name)):
+                relative_directory = os.path.relpath(directory, self.snapshot_dir).replace(os.sep, "/")
+                output += [f"{relative_directory}/{file_name}" for file_name in file_names if file_name.endswith(".svg")]
+        return output
+
+    def _get_first_difference(self, expected : str, actual : str) -> str:
+        """Describe the first line on which two canonical documents differ"""
+        expected_lines, actual_lines = expected.splitlines(), actual.splitlines()
+        for line_no, (expected_line, actual_line) in enumerate(zip(expected_lines, actual_lines), 1):
+            if expected_line != actual_line:
+                return f"  line {line_no}:\n  - {expected_line[:200]}\n  + {actual_line[:200]}"
+        return f"  {len(expected_lines)} lines expected, {len(actual_lines)} rendered"
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+from typing import TYPE_CHECKING
+import csv
+import json
+import logging
+import os
+
+if TYPE_CHECKING:
+    from .models.model import Model
+    import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+CLUB_COLUMNS = (
+    "full_name", "short_name", "seasons", "best_overall", "best_season", "worst_overall", "worst_season",
+    "promotions", "relegations", "longest_promotion_streak", "longest_relegation_streak", "administrative_jumps",
+)
+TIER_COLUMNS = ("full_name", "short_name", "tier", "seasons", "best_position", "worst_position")
+DERBY_COLUMNS = ("derby", "derby_name", "full_name", "short_name", "shared_seasons", "same_tier_seasons", "best_placed_seasons")
+
+
+class StatisticsEngine(object):
+    """Derived statistics of the ingested club histories: seasons per tier, best/worst finishes,
+    promotion/relegation streaks, administrative jumps and derby tier parity.
+    Every club's seasons are walked once, and the results are kept as rows ready for export."""
+    def __init__(self, club_info : dict[str, dict], derbies : list[dict]):
+        """:param club_info: Ingested club informations, keyed by club full name.
+        :param derbies: Derbies of the catalogue (full_name, clubs and short_name)."""
+        self.club_info = club_info
+        self.derbies = derbies
+        self.clubs, self.tiers, self.derby_clubs = [], [], []
+
+    def compute(self) -> "StatisticsEngine":
+        """Compute the statistics of every club and derby"""
+        self.clubs, self.tiers, self.derby_clubs = [], [], []
+        for club_info in self.club_info.values():
+            club_row, tier_rows = self.get_club_statistics(club_info)
+            self.clubs.append(club_row)
+            self.tiers += tier_rows
+        for derby in self.derbies:
+            self.derby_clubs += self.get_derby_statistics(derby)
+        logger.info(f"Computed statistics of {len(self.clubs)} clubs and {len(self.derbies)} derbies")
+        return self
+
+    def get_club_statistics(self, club_info : dict) -> tuple[dict, list[dict]]:
+        """Walk a club's seasons once, as get_plot_line_paths does: a season counts when both its league position
+        and overall position are known, and a change of more than one tier between two consecutive counted
+        seasons is an administrative jump. Streaks are broken by seasons without data.
+
+        :param club_info: Club informations gathered from source material.
+        :return: Club statistics row, and one row per tier the club played in."""
+        row = dict.fromkeys(CLUB_COLUMNS, 0)
+        row.update({"full_name": club_info["full_name"], "short_name": club_info["short_name"]})
+        row.update(dict.fromkeys(("best_overall", "best_season", "worst_overall", "worst_season")))
+        tiers = {}
+        previous_league, promotion_streak, relegation_streak = None, 0, 0
+
+        for season, values in club_info["data"].items():
+            league, position, overall = values["league"], values["position"], values["overall"]
+            if overall == -1 or position == -1:
+                previous_league, promotion_streak, relegation_streak = None, 0, 0
+                continue
+
+            row["seasons"] += 1
+            if row["best_overall"] is None or overall < row["best_overall"]:
+                row["best_overall"], row["best_season"] = overall, season
+            if row["worst_overall"] is None or overall > row["worst_overall"]:
+                row["worst_overall"], row["worst_season"] = overall, season
+
+            tier = tiers.get(league)
+            if tier is None:
+                tier = tiers[league] = {
+                    "full_name": club_info["full_name"], "short_name": club_info["short_name"],
+                    "tier": league, "seasons": 0, "best_position": position, "worst_position": position,
+                }
+            tier["seasons"] += 1
+            tier["best_position"] = min(tier["best_position"], position)
+            tier["worst_position"] = max(tier["worst_position"], position)
+
+            if previous_league is not None:
+                if league < previous_league:
+                    row["promotions"] += 1
+                    promotion_streak, relegation_streak = promotion_streak + 1, 0
+                elif league > previous_league:
+                    row["relegations"] += 1
+                    promotion_streak, relegation_streak = 0, relegation_streak + 1
+                else:
+                    promotion_streak, relegation_streak = 0, 0
+                if abs(league - previous_league) > 1:
+                    row["administrative_jumps"] += 1
+                row["longest_promotion_streak"] = max(row["longest_promotion_streak"], promotion_streak)
+                row["longest_relegation_streak"] = max(row["longest_relegation_streak"], relegation_streak)
+            previous_league = league
+
+        return row, [tiers[league] for league in sorted(tiers)]
+
+    def get_derby_statistics(self, derby : dict) -> list[dict]:
+        """Compare the derby clubs over the seasons in which all of them have data: how many were
+        played in the same tier, and how often each club finished above the others.
+
+        :param derby: Derby of the catalogue.
+        :return: One row per derby club."""
+        clubs = [self.club_info[club] for club in derby["clubs"]]
+        shared_seasons, same_tier_seasons = 0, 0
+        best_placed = dict.fromkeys(derby["clubs"], 0)
+
+        for season in clubs[0]["data"]:
+            values = [club_info["data"].get(season) for club_info in clubs]
+            if any(value is None or value["overall"] == -1 or value["position"] == -1 for value in values):
+                continue
+            shared_seasons += 1
+            if len({value["league"] for value in values}) == 1:
+                same_tier_seasons += 1
+            best_idx = min(range(len(values)), key=lambda i: values[i]["overall"])
+            best_placed[derby["clubs"][best_idx]] += 1
+
+        derby_name = derby["full_name"] or " vs ".join(derby["clubs"])
+        return [
+            {
+                "derby": derby["short_name"], "derby_name": derby_name,
+                "full_name": club_info["full_name"], "short_name": club_info["short_name"],
+                "shared_seasons": shared_seasons, "same_tier_seasons": same_tier_seasons,
+                "best_placed_seasons": best_placed[club_info["full_name"]],
+            }
+            for club_info in clubs
+        ]
+
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    #                                     EXPORTS                                     #
+    # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = = #
+    def export_csv(self, directory : str):
+        """Write club_statistics.csv, club_tier_statistics.csv and derby_statistics.csv into a directory"""
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        for file_name, columns, rows in (
+            ("club_statistics.csv", CLUB_COLUMNS, self.clubs),
+            ("club_tier_statistics.csv", TIER_COLUMNS, self.tiers),
+            ("derby_statistics.csv", DERBY_COLUMNS, self.derby_clubs),
+        ):
+            with open(os.path.join(directory, file_name), "w", encoding="utf-8", newline="") as fp:
+                writer = csv.DictWriter(fp, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+        logger.info(f"Wrote statistics CSV files to {directory}")
+
+    def export_json(self, file_path : str):
+        """Write every statistics row into one JSON file, grouped as clubs, tiers and derbies"""
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(file_path, "w", encoding="utf-8") as fp:
+            json.dump({"clubs": self.clubs, "tiers": self.tiers, "derbies": self.derby_clubs}, fp, ensure_ascii=False, indent=2)
+        logger.info(f"Wrote statistics JSON file {file_path}")
+
+    def write_to_database(self, cr : "psycopg2.extensions.cursor", models : dict[str, "Model"]):
+        """Replace the statistics tables' contents in a single transaction, linking the rows to the clubs loaded by load-db.
+
+        :param cr: Database cursor.
+        :param models: Configured models, as returned by configure_models()."""
+        club_ids = {club.short_name: club.id for club in models["club"].search(cr, []) if club.id}
+        missing = {row["full_name"] for row in self.clubs if row["short_name"] not in club_ids}
+        if missing:
+            logger.warning(f"Skipping the statistics of {len(missing)} club(s) not loaded in the database (run load-db)")
+
+        try:
+            for table, rows, columns in (
+                ("club_statistics", self.clubs, CLUB_COLUMNS),
+                ("club_tier_statistics", self.tiers, TIER_COLUMNS),
+                ("derby_statistics", self.derby_clubs, DERBY_COLUMNS),
+            ):
+                field_names = models[table].get_field_names()
+                fields = [column for column in columns if column in field_names and column != "club_id"]
+                models[table].truncate(cr, commit=False)
+                models[table].create(cr, [
+                    {"club_id": club_ids[row["short_name"]], **{field: row[field] for field in fields}}
+                    for row in rows if row["short_name"] in club_ids
+                ])
+        except Exception:
+            cr.connection.rollback()
+            raise
+        cr.connection.commit()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from collections import Counter
+from lxml import etree
+import re
+
+# Attributes moved into CSS classes when the same combination is shared by several elements
+PRESENTATION_ATTRIBUTES = ("fill", "stroke", "stroke-width", "stroke-linecap", "stroke-linejoin", "stroke-dasharray", "font-size", "text-anchor")
+NUMERIC_ATTRIBUTES = ("x", "y", "width", "height")
+
+_RE_PATH_COMMAND = re.compile(r"([MmLlHhVvZz])([^MmLlHhVvZz]*)")
+_RE_NUMBER = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def compact_svg(root : etree._Element, precision : int = 2) -> etree._Element:
+    """Rewrite a generated SVG document into a smaller, visually identical one (in place):
+    - comments are dropped;
+    - coordinates are rounded to `precision` decimals and written without trailing zeros;
+    - consecutive path "l" commands going in the same direction are merged;
+    - plot line paths are moved into <defs>, only referenced by their <use> elements;
+    - presentation attributes/styles shared by several elements become CSS classes.
+
+    :param root: svg element as built by GraphGenerator.
+    :param precision: Number of decimal places kept on coordinates.
+    :return root: The same, compacted, svg element."""
+    for comment in root.xpath("//comment()"):
+        comment.getparent().remove(comment)
+
+    for element in root.iter(etree.Element):
+        for name in NUMERIC_ATTRIBUTES:
+            if name in element.attrib:
+                element.set(name, _format_number(float(element.get(name)), precision))
+        if "d" in element.attrib:
+            element.set("d", compact_path(element.get("d"), precision))
+
+    _move_plot_paths_to_defs(root)
+    _set_style_classes(root)
+    return root
+
+
+def compact_path(d : str, precision : int = 2) -> str:
+    """Round a path's numbers and merge consecutive collinear relative line commands.
+
+    :param d: Path data.
+    :param precision: Number of decimal places kept.
+    :return: Compacted path data."""
+    commands = []
+    for command, arguments in _RE_PATH_COMMAND.findall(d):
+        numbers = [float(number) for number in _RE_NUMBER.findall(arguments)]
+        if command == "l":
+            for i in range(0, len(numbers) - 1, 2):
+                dx, dy = numbers[i], numbers[i + 1]
+                previous = commands[-1] if commands else None
+                # Same direction: cross product is zero and dot product is positive
+                if previous and previous[0] == "l" and previous[1] * dy == previous[2] * dx and previous[1] * dx + previous[2] * dy > 0:
+                    commands[-1] = ("l", previous[1] + dx, previous[2] + dy)
+                else:
+                    commands.append(("l", dx, dy))
+        else:
+            commands.append((command, *numbers))
+
+    output = []
+    for command, *numbers in commands:
+        arguments = ""
+        for number in numbers:
+            number_str = _format_number(number, precision)
+            arguments += number_str if not arguments or number_str.startswith("-") else f",{number_str}"
+        output.append(f"{command}{arguments}")
+    return "".join(output)
+
+
+def _format_number(value : float, precision : int) -> str:
+    """Format a number with at most `precision` decimals and no trailing zeros"""
+    output = f"{round(value, precision):.{precision}f}".rstrip("0").rstrip(".")
+    return "0" if output in ("-0", "") else output
+
+
+def _move_plot_paths_to_defs(root : etree._Element):
+    """Move the <path> of each plot line group (only drawn through its <use> elements) into one <defs>"""
+    defs = None
+    for group in root.iter("g"):
+        uses = group.findall("use")
+        if not uses:
+            continue
+        for path in group.findall("path"):
+            if defs is None:
+                # Namespaced tag (serialized the same way under the default namespace), as svglib
+                # looks <defs> up by their qualified tag when rendering an in-memory tree
+                defs = etree.Element(etree.QName(root.nsmap.get(None), "defs"))
+                root.insert(0, defs)
+            group.remove(path)
+            defs.append(path)
+
+
+def _set_style_classes(root : etree._Element):
+    """Replace presentation attributes and style attributes shared by more than one element with CSS classes"""
+    declarations = {}
+    for element in root.iter(etree.Element):
+        declaration = [f"{name}:{element.get(name)}" for name in PRESENTATION_ATTRIBUTES if name in element.attrib]
+        if "style" in element.attrib:
+            declaration += [rule.replace(" ", "") for rule in element.get("style").split(";") if rule.strip()]
+        if declaration:
+            declarations[element] = ";".join(declaration)
+
+    counts = Counter(declarations.values())
+    class_names = {}
+    for element, declaration in declarations.items():
+        if counts[declaration] < 2:
+            continue
+        if declaration not in class_names:
+            class_names[declaration] = f"s{len(class_names)}"
+        for name in (*PRESENTATION_ATTRIBUTES, "style"):
+            element.attrib.pop(name, None)
+        element.set("class", class_names[declaration])
+
+    if class_names:
+        style = etree.Element("style")
+        style.text = "".join(f".{name}{{{declaration}}}" for declaration, name in class_names.items())
+        root.insert(0, style)
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+from .graph_generator import GraphGenerator
+from lxml import etree
+from time import perf_counter, sleep
+import logging
+import os
+import posixpath
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+SPREADSHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+RELATIONSHIPS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+OFFICE_RELATIONSHIPS_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+class WorkbookWatcher(object):
+    """Long-running watch mode: polls the workbook and, whenever it is saved, re-ingests it and
+    re-renders only the graphs of the clubs whose data changed and of the derbies featuring them"""
+    def __init__(self, generator : GraphGenerator, interval : float = 0.5):
+        """:param generator: Generator holding the ingested data, kept in memory between changes.
+        :param interval: Seconds between two checks of the workbook's modification time."""
+        if not generator.workbook_path or generator.streaming:
+            raise ValueError("Watch mode needs a generator ingested from the workbook, without streaming")
+        self.generator = generator
+        self.workbook_path = generator.workbook_path
+        self.interval = interval
+        self.stat = self.get_stat()
+        self.checksums = self.get_sheet_checksums()
+        # Clubs and derbies (by short name) whose graphs failed to render on the last refresh
+        self.retry_clubs, self.retry_derbies = set(), set()
+
+    def watch(self):
+        """Check the workbook every interval until interrupted"""
+        logger.info(f"Watching {self.workbook_path} for changes (every {self.interval}s)")
+        try:
+            while True:
+                sleep(self.interval)
+                self.poll()
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+
+    def poll(self) -> bool:
+        """Check the workbook once, refreshing the graphs if it was saved since the last check.
+
+        :return: Whether the workbook changed."""
+        import openpyxl
+        stat = self.get_stat()
+        if stat is None or stat == self.stat:
+            return False
+
+        # Wait for the editor to finish writing the file before parsing it
+        sleep(min(self.interval, 0.1))
+        if self.get_stat() != stat:
+            return False
+
+        try:
+            checksums = self.get_sheet_checksums()
+            wb = openpyxl.load_workbook(filename=self.workbook_path, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, KeyError, OSError) as e:
+            # Partially written or locked file: retried on the next check
+            logger.warning(f"Could not read {self.workbook_path}, retrying: {e!r}")
+            return False
+
+        try:
+            self.refresh(checksums, wb)
+        except Exception:
+            # Unusable content (e.g. a half-finished edit or a renamed worksheet): nothing was applied
+            logger.exception(f"Could not process {self.workbook_path}, keeping the previous data until it is saved again")
+        finally:
+            wb.close()
+        self.stat = stat
+        return True
+
+    def refresh(self, checksums : dict[str, int], wb : "openpyxl.Workbook"):
+        """Re-ingest the changed worksheets and re-render the affected graphs, along with those which
+        failed to render on the previous refresh.
+
+        :param checksums: Checksums of the saved workbook's parts (see get_sheet_checksums).
+        :param wb: Saved workbook, opened read-only."""
+        start = perf_counter()
+        generator = self.generator
+        changed_parts = {name for name in checksums.keys() | self.checksums.keys() if checksums.get(name) != self.checksums.get(name)}
+        # Cell text lives in the shared strings part and cell colors in the styles part
+        league_sizes_changed = bool(changed_parts & {"League Sizes", "xl/sharedStrings.xml"})
+        clubs_changed = bool(changed_parts & {"Clubs", "xl/sharedStrings.xml", "xl/styles.xml"})
+        if not league_sizes_changed and not clubs_changed and not self.retry_clubs and not self.retry_derbies:
+            logger.info(f"{self.workbook_path} saved without changes to the graphs' data")
+            self.checksums = checksums
+            return
+
+        # Both worksheets are parsed before anything is applied, so that a failure leaves the generator
+        # (and self.checksums) as last rendered, and the next save is compared against that state
+        generator.wb = wb
+        league_sizes = generator.read_league_sizes() if league_sizes_changed else None
+        club_info = {info["full_name"]: info for info in generator.iter_club_info()} if clubs_changed else generator.club_info
+
+        previous_club_info, previous_club_names = generator.club_info, generator.club_names
+        generator.club_info, generator.club_names = club_info, list(club_info)
+        try:
+            generator.set_derbies(generator.derby_catalogue_path)
+        except ValueError as e:
+            logger.error(f"Keeping the previous data, as the derby catalogue does not match the workbook: {e}")
+            generator.club_info, generator.club_names = previous_club_info, previous_club_names
+            generator.set_derbies(generator.derby_catalogue_path)
+            return
+
+        # League sizes move every tier boundary, so every graph has to be redrawn
+        redraw_all = league_sizes is not None and league_sizes[0] != generator.league_sizes
+        if redraw_all:
+            generator.league_sizes, generator.pyramid_size, generator.max_depth = league_sizes
+            generator.no_seasons = len(generator.league_sizes)
+            generator.set_geometry()
+        self.checksums = checksums
+
+        if redraw_all:
+            clubs = list(generator.club_info)
+        else:
+            clubs = [name for name, club_info in generator.club_info.items() if previous_club_info.get(name) != club_info or name in self.retry_clubs]
+        for name in previous_club_info.keys() - generator.club_info.keys():
+            logger.warning(f"{name} was removed from the workbook, its graphs are left in place")
+
+        derbies = {short_name: generator.derby_catalogue.by_short_name[short_name] for short_name in self.retry_derbies if short_name in generator.derby_catalogue.by_short_name}
+        for name in clubs:
+            for derby in generator.derby_catalogue.by_club.get(name, []):
+                derbies[derby["short_name"]] = derby
+
+        # The data is applied by now: graphs which fail to render are retried on the next refresh
+        self.retry_clubs, self.retry_derbies = set(), set()
+        for name in clubs:
+            try:
+                generator.generate_file(generator.club_info[name])
+            except Exception:
+                logger.exception(f"Could not render the graph of {name}, retrying on the next save")
+                self.retry_clubs.add(name)
+        for short_name, derby in derbies.items():
+            try:
+                generator.generate_file_derby(derby, generator.club_info)
+            except Exception:
+                logger.exception(f"Could not render the derby graph {short_name}, retrying on the next save")
+                self.retry_derbies.add(short_name)
+        failures = f", {len(self.retry_clubs) + len(self.retry_derbies)} failed" if self.retry_clubs or self.retry_derbies else ""
+        logger.info(f"Re-rendered {len(clubs)} club and {len(derbies)} derby graphs{failures} in {(perf_counter() - start) * 1000:.0f}ms")
+
+    def get_stat(self) -> tuple[int, int] | None:
+        """Modification time and size of the workbook, or None while it is missing (e.g. being replaced)"""
+        try:
+            stat = os.stat(self.workbook_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def get_sheet_checksums(self) -> dict[str, int]:
+        """CRC of each part of the workbook package, worksheets being keyed by their sheet name,
+        so that a change can be traced to the worksheet(s) it affects without parsing them"""
+        with zipfile.ZipFile(self.workbook_path) as zf:
+            sheet_names = {}
+            workbook = etree.fromstring(zf.read("xl/workbook.xml"))
+            relationships = etree.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+            targets = {rel.get("Id"): rel.get("Target") for rel in relationships.iter(f"{{{RELATIONSHIPS_NS}}}Relationship")}
+            for sheet in workbook.iter(f"{{{SPREADSHEET_NS}}}sheet"):
+                target = targets.get(sheet.get(f"{{{OFFICE_RELATIONSHIPS_NS}}}id"), "")
+                member = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+                sheet_names[member] = sheet.get("name")
+            return {sheet_names.get(info.filename, info.filename): info.CRC for info in zf.infolist()}